@@ -7,13 +7,18 @@ import threading
 import queue
 import time
 import os
+import random
 import requests
+from urllib3.util.retry import Retry
 import sys
 import re
-from typing import List, Dict, Callable, Optional, Tuple
+from array import array
+from collections import deque
+from typing import List, Dict, Callable, Optional, Tuple, Mapping
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from enum import Enum
+from types import MappingProxyType
 from urllib.parse import urlparse, urljoin
 
 
@@ -37,6 +42,196 @@ def _safe_print(*args, **kwargs):
 print = _safe_print
 
 
+# 下载线程的控制台输出先入队，由后台线程写出，避免多个工作线程在stdout上串行阻塞
+_console_queue = queue.SimpleQueue()
+_console_thread: Optional[threading.Thread] = None
+_console_lock = threading.Lock()
+
+
+def _console_print(message: str) -> None:
+    """异步输出一行到控制台（供下载工作线程使用）"""
+    global _console_thread
+    _console_queue.put(message)
+    if _console_thread is None:
+        with _console_lock:
+            if _console_thread is None:
+                _console_thread = threading.Thread(target=_console_drain_loop, daemon=True, name="dl-console")
+                _console_thread.start()
+
+
+def _console_drain_loop() -> None:
+    while True:
+        _safe_print(_console_queue.get())
+
+
+# 浏览器请求头模板，Referer 按URL所在目录单独补充
+_BASE_HEADERS = (
+    ('User-Agent', 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'),
+    ('Accept', '*/*'),
+    ('Accept-Language', 'zh-CN,zh;q=0.9,en;q=0.8'),
+    ('Accept-Encoding', 'gzip, deflate, br'),
+    ('Connection', 'keep-alive'),
+    ('Sec-Fetch-Dest', 'empty'),
+    ('Sec-Fetch-Mode', 'cors'),
+    ('Sec-Fetch-Site', 'same-origin'),
+    ('Cache-Control', 'no-cache'),
+    ('Pragma', 'no-cache'),
+)
+
+# 日志中使用的HTTP状态码说明
+_STATUS_TEXT = {
+    200: "OK",
+    206: "Partial Content",
+    301: "Moved Permanently",
+    302: "Found",
+    304: "Not Modified",
+    403: "Forbidden",
+    404: "Not Found",
+    416: "Range Not Satisfiable",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable"
+}
+
+# 详细日志中记录的响应头及其显示名称
+_IMPORTANT_HEADERS = (
+    ('content-length', '大小'),
+    ('content-type', '类型'),
+    ('content-range', '范围'),
+    ('accept-ranges', '支持范围'),
+    ('server', '服务器'),
+    ('cache-control', '缓存控制'),
+)
+
+
+def _segment_label(task_id: str) -> str:
+    """从任务ID中提取片段编号，用于日志显示"""
+    _, sep, segment_index = task_id.rpartition("_segment_")
+    return f"片段 {segment_index}" if sep else ""
+
+
+# 重试退避的最长基准时间（秒）
+_MAX_BACKOFF = 30
+
+
+def _backoff_delay(attempt: int) -> float:
+    """指数退避加随机抖动，避免大量片段同时失败后在同一时刻集中重试"""
+    return random.uniform(0.5, 1.5) * min(2 ** attempt, _MAX_BACKOFF)
+
+
+def _format_size(size: int) -> str:
+    """格式化字节数，用于日志显示"""
+    if size < 1024:
+        return f"{size} B"
+    if size < 1048576:
+        return f"{size/1024:.2f} KB"
+    return f"{size/1048576:.2f} MB"
+
+
+# 进程级共享的HTTP会话 - 所有调度器复用同一个连接池，保持keep-alive连接
+_shared_session: Optional[requests.Session] = None
+_shared_pool_maxsize = 0
+_shared_session_lock = threading.Lock()
+
+
+def _get_shared_session(pool_maxsize: int) -> requests.Session:
+    """
+    获取进程级共享会话，连接池不足时按需扩容
+    
+    pool_connections 是按主机划分的连接池个数，M3U8 片段几乎都来自同一主机，
+    因此保持较小值；pool_maxsize 才是单个主机可复用的连接数，调用方应按所有任务的
+    总并发数申请（BatchDownloader 按 任务数 × 每任务并发数）。
+    pool_block=False：连接池由所有调度器共用，总并发偶尔超过申请的大小时，
+    超出的请求临时新建连接、用完关闭，而不是阻塞等待其他任务归还连接。
+    """
+    global _shared_session, _shared_pool_maxsize
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = requests.Session()
+        if pool_maxsize > _shared_pool_maxsize:
+            old_adapters = {_shared_session.adapters[prefix] for prefix in ('http://', 'https://')
+                            if prefix in _shared_session.adapters}
+            retry_strategy = Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=("GET",)
+            )
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=8,
+                pool_maxsize=pool_maxsize,
+                pool_block=False,
+                max_retries=retry_strategy
+            )
+            _shared_session.mount('http://', adapter)
+            _shared_session.mount('https://', adapter)
+            _shared_pool_maxsize = pool_maxsize
+            # 关闭被替换的适配器：空闲连接立即关闭，正在使用的连接归还时关闭
+            for old_adapter in old_adapters:
+                old_adapter.close()
+        return _shared_session
+
+
+# 标准下载模式下单次读取大小的自适应范围和速度阈值：
+# 快速链路上加大读取减少循环和write次数；慢速链路上减小读取，避免一次read阻塞过久导致进度停滞
+_MIN_READ_SIZE = 8 * 1024
+_MAX_READ_SIZE = 256 * 1024
+_FAST_LINK_SPEED = 5 * 1024 * 1024
+_SLOW_LINK_SPEED = 512 * 1024
+
+# 标准下载模式的文件写缓冲区：多个读取块在用户态合并后再下发一次write，
+# 常见大小的TS片段整段只需一到两次系统调用
+_WRITE_BUFFER_SIZE = 1024 * 1024
+
+# 错误响应体不超过此大小时先读完再关闭，使连接回到keep-alive池而不是被直接断开
+_DRAIN_LIMIT = 64 * 1024
+
+
+def _discard_body(response: requests.Response) -> None:
+    """读完并丢弃较小的响应体，让底层连接可以被下一个片段复用"""
+    content_length = response.headers.get('content-length')
+    if content_length is None or not content_length.isdigit() or int(content_length) > _DRAIN_LIMIT:
+        return
+    try:
+        response.content
+    except requests.exceptions.RequestException:
+        pass
+
+
+class BufferPool:
+    """
+    可复用的写缓冲区池
+    
+    内存优化模式每个片段都需要一块数MB的缓冲区，逐个新建会反复向系统申请/归还
+    大块内存。池中只保留固定大小的缓冲区，按需创建，归还后留给下一个片段使用。
+    """
+    
+    def __init__(self, buf_size: int = 10 * 262144, max_pooled: int = 16):
+        self.buf_size = buf_size
+        self.max_pooled = max_pooled
+        self._pool = deque()
+        self._lock = threading.Lock()
+    
+    def acquire(self, size: int) -> bytearray:
+        """取出一块缓冲区；请求大小与池规格不符时直接新建"""
+        if size == self.buf_size:
+            with self._lock:
+                if self._pool:
+                    return self._pool.pop()
+        return bytearray(size)
+    
+    def release(self, buf: bytearray) -> None:
+        """归还缓冲区，规格不符或池已满时交给垃圾回收"""
+        if len(buf) != self.buf_size:
+            return
+        with self._lock:
+            if len(self._pool) < self.max_pooled:
+                self._pool.append(buf)
+
+
+_buffer_pool = BufferPool()
+
+
 class DownloadPriority(Enum):
     """下载优先级枚举"""
     LOW = 0
@@ -45,7 +240,7 @@ class DownloadPriority(Enum):
     URGENT = 3
 
 
-@dataclass
+@dataclass(slots=True)
 class DownloadTask:
     """下载任务数据结构"""
     task_id: str
@@ -54,15 +249,11 @@ class DownloadTask:
     priority: DownloadPriority = DownloadPriority.NORMAL
     retry_count: int = 3
     max_speed: Optional[int] = None
-    chunk_size: int = 65536
+    chunk_size: int = 262144  # 256KB，减少Python循环次数和write系统调用
     memory_efficient: bool = True  # 内存优化模式
-    
-    def __lt__(self, other):
-        """优先级比较，数值越大优先级越高"""
-        return self.priority.value > other.priority.value
 
 
-@dataclass
+@dataclass(slots=True)
 class DownloadResult:
     """下载结果数据结构"""
     task: DownloadTask
@@ -73,6 +264,34 @@ class DownloadResult:
     download_time: float = 0.0
 
 
+class _ResizableSemaphore:
+    """可动态调整许可数的信号量 - 在不重建线程池的情况下限制实际并发数"""
+    
+    def __init__(self, permits: int):
+        self._cond = threading.Condition(threading.Lock())
+        self._permits = permits
+        self._in_use = 0
+    
+    def acquire(self):
+        """获取许可，超出当前许可数时阻塞等待"""
+        with self._cond:
+            while self._in_use >= self._permits:
+                self._cond.wait()
+            self._in_use += 1
+    
+    def release(self):
+        """释放许可"""
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+    
+    def resize(self, permits: int):
+        """调整许可数，已持有的许可不受影响，缩容在其释放后自然生效"""
+        with self._cond:
+            self._permits = permits
+            self._cond.notify_all()
+
+
 class AdaptiveThreadPool:
     """自适应线程池 - 根据网络状况动态调整线程数"""
     
@@ -92,7 +311,14 @@ class AdaptiveThreadPool:
         self.adaptive_interval = adaptive_interval
         self._lock = threading.Lock()
         self._executor = None
-        self._performance_metrics = []
+        # 线程池按最大线程数创建且不再重建，实际并发由许可数控制
+        self._admit = _ResizableSemaphore(self.current_workers)
+        # 性能指标环形缓冲区（按列存储），只保留最近100个指标
+        self._metric_speed = array('d', [0.0]) * 100
+        self._metric_response_time = array('d', [0.0]) * 100
+        self._metric_success = array('B', [0]) * 100
+        self._metric_head = 0  # 下一个写入位置
+        self._metric_count = 0
         self._last_adjustment = time.time()
         self._running = False
         
@@ -107,7 +333,7 @@ class AdaptiveThreadPool:
         """启动线程池"""
         with self._lock:
             if self._executor is None:
-                self._executor = ThreadPoolExecutor(max_workers=self.current_workers)
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dl")
                 self._running = True
                 # 启动自适应调整线程
                 threading.Thread(target=self._adaptive_adjustment, daemon=True).start()
@@ -116,7 +342,15 @@ class AdaptiveThreadPool:
         """提交任务到线程池"""
         if self._executor is None:
             self.start()
-        return self._executor.submit(fn, *args, **kwargs)
+        return self._executor.submit(self._run_admitted, fn, *args, **kwargs)
+    
+    def _run_admitted(self, fn, *args, **kwargs):
+        """在获得并发许可后执行任务"""
+        self._admit.acquire()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._admit.release()
     
     def _adaptive_adjustment(self):
         """自适应调整线程数"""
@@ -129,45 +363,59 @@ class AdaptiveThreadPool:
     
     def _adjust_thread_count(self):
         """根据性能指标调整线程数"""
-        if len(self._performance_metrics) < 3:
-            return
-            
-        # 计算平均下载速度和成功率
-        recent_metrics = self._performance_metrics[-10:]  # 最近10个任务
-        avg_speed = sum(m['speed'] for m in recent_metrics) / len(recent_metrics)
-        success_rate = sum(1 for m in recent_metrics if m['success']) / len(recent_metrics)
-        avg_response_time = sum(m['response_time'] for m in recent_metrics) / len(recent_metrics)
-        
         with self._lock:
+            if self._metric_count < 3:
+                return
+            
+            # 计算成功率和平均响应时间（最近10个任务）
+            count, success_count, _, response_time_sum = self._aggregate_recent_metrics(10)
+            success_rate = success_count / count
+            avg_response_time = response_time_sum / count
+            
             old_workers = self.current_workers
             
             # 基于性能指标调整线程数
             if success_rate > 0.9 and avg_response_time < 2.0 and self.current_workers < self.max_workers:
                 # 性能良好，增加线程数
                 self.current_workers = min(self.current_workers + 2, self.max_workers)
-            elif success_rate < 0.7 or avg_response_time > 5.0 and self.current_workers > self.min_workers:
+            elif (success_rate < 0.7 or avg_response_time > 5.0) and self.current_workers > self.min_workers:
                 # 性能较差，减少线程数
                 self.current_workers = max(self.current_workers - 1, self.min_workers)
             
-            # 如果线程数发生变化，重新创建线程池
+            # 如果线程数发生变化，原地调整并发许可数（不重建线程池）
             if old_workers != self.current_workers:
-                if self._executor:
-                    self._executor.shutdown(wait=True)
-                self._executor = ThreadPoolExecutor(max_workers=self.current_workers)
+                self._admit.resize(self.current_workers)
                 print(f"线程池大小调整: {old_workers} -> {self.current_workers}")
     
     def record_performance(self, success: bool, speed: float, response_time: float):
         """记录性能指标"""
-        metric = {
-            'success': success,
-            'speed': speed,
-            'response_time': response_time,
-            'timestamp': time.time()
-        }
-        self._performance_metrics.append(metric)
-        # 只保留最近100个指标
-        if len(self._performance_metrics) > 100:
-            self._performance_metrics.pop(0)
+        with self._lock:
+            head = self._metric_head
+            self._metric_speed[head] = speed
+            self._metric_response_time[head] = response_time
+            self._metric_success[head] = 1 if success else 0
+            self._metric_head = (head + 1) % len(self._metric_speed)
+            if self._metric_count < len(self._metric_speed):
+                self._metric_count += 1
+    
+    def _aggregate_recent_metrics(self, window: int) -> Tuple[int, int, float, float]:
+        """
+        单次遍历最近window个指标（调用方需持有锁）
+        
+        Returns:
+            (指标数, 成功数, 速度总和, 响应时间总和)
+        """
+        count = min(window, self._metric_count)
+        success_count = 0
+        speed_sum = 0.0
+        response_time_sum = 0.0
+        index = self._metric_head
+        for _ in range(count):
+            index = index - 1 if index > 0 else len(self._metric_speed) - 1
+            success_count += self._metric_success[index]
+            speed_sum += self._metric_speed[index]
+            response_time_sum += self._metric_response_time[index]
+        return count, success_count, speed_sum, response_time_sum
     
     def record_task_completion(self, success: bool, download_time: float, downloaded_bytes: int):
         """记录任务完成统计"""
@@ -188,11 +436,11 @@ class AdaptiveThreadPool:
             avg_download_speed = (self._total_downloaded_bytes / self._total_download_time / 1024 / 1024) if self._total_download_time > 0 else 0
             
             # 计算最近性能指标
-            if len(self._performance_metrics) > 0:
-                recent_metrics = self._performance_metrics[-20:]  # 最近20个任务
-                recent_success_rate = sum(1 for m in recent_metrics if m['success']) / len(recent_metrics) * 100
-                recent_avg_speed = sum(m['speed'] for m in recent_metrics) / len(recent_metrics)
-                recent_avg_response_time = sum(m['response_time'] for m in recent_metrics) / len(recent_metrics)
+            count, success_count, speed_sum, response_time_sum = self._aggregate_recent_metrics(20)  # 最近20个任务
+            if count > 0:
+                recent_success_rate = success_count / count * 100
+                recent_avg_speed = speed_sum / count
+                recent_avg_response_time = response_time_sum / count
             else:
                 recent_success_rate = 0
                 recent_avg_speed = 0
@@ -222,24 +470,38 @@ class AdaptiveThreadPool:
 class SmartDownloadScheduler:
     """智能下载调度器 - 优化任务分配和负载均衡"""
     
-    def __init__(self, max_concurrent_downloads: int = 10, log_callback: Optional[Callable[[str], None]] = None):
+    def __init__(self, max_concurrent_downloads: int = 10, log_callback: Optional[Callable[[str], None]] = None,
+                 log_verbosity: int = 1, buffer_pool: Optional[BufferPool] = None):
         """
         初始化智能下载调度器
         
         Args:
             max_concurrent_downloads: 最大并发下载数
             log_callback: 日志回调函数，用于记录日志信息
+            log_verbosity: 日志详细程度，>=2 时额外记录响应头和重定向信息
+            buffer_pool: 内存优化下载使用的缓冲区池，不指定时使用进程级共享的缓冲区池
         """
         self.max_concurrent_downloads = max_concurrent_downloads
-        self.download_queue = queue.PriorityQueue()
-        self.active_downloads: Dict[str, threading.Thread] = {}
-        self.active_download_info: Dict[str, Dict[str, any]] = {}  # 存储活跃下载的详细信息
+        self._buffer_pool = buffer_pool or _buffer_pool
+        # 每个优先级一个FIFO队列（SimpleQueue为C实现，入队出队无需Python层锁），调度时从高到低取
+        self._priority_queues = [queue.SimpleQueue() for _ in DownloadPriority]
+        self._task_available = threading.Event()
+        self._completion_cv = threading.Condition()  # 每个任务结束或调度器停止时通知等待方
+        # 已入队但尚未结束的任务数（含已出队、还没占用槽位的任务），由 _completion_cv 的锁保护
+        self._outstanding = 0
         self.completed_downloads: Dict[str, DownloadResult] = {}
         self._lock = threading.Lock()
         self._stop_event = threading.Event()
         self._scheduler_thread = None
-        self._session_pool = requests.Session()
+        self._executor: Optional[ThreadPoolExecutor] = None  # 下载工作线程池，随调度器启动创建
+        self._headers_cache: Dict[str, Mapping[str, str]] = {}  # Referer -> 只读请求头
+        self._session_pool = _get_shared_session(max_concurrent_downloads * 2)
         self.log_callback = log_callback  # 日志回调函数
+        self._log_verbosity = log_verbosity
+        # 日志先入队，由单独的日志线程调用回调，避免下载线程阻塞在GUI/控制台输出上
+        self._log_queue = queue.SimpleQueue()
+        self._log_thread: Optional[threading.Thread] = None
+        self._log_thread_lock = threading.Lock()
         
         # 性能监控统计
         self._total_tasks = 0
@@ -247,191 +509,199 @@ class SmartDownloadScheduler:
         self._failed_tasks = 0
         self._total_download_time = 0.0
         self._total_downloaded_bytes = 0
+        self._total_expected_bytes = 0  # 已结束任务的文件总大小之和
         self._peak_concurrent_downloads = 0
         
-        # 配置会话池
-        adapter = requests.adapters.HTTPAdapter(
-            pool_connections=max_concurrent_downloads * 2,
-            pool_maxsize=max_concurrent_downloads * 2,
-            max_retries=3
-        )
-        self._session_pool.mount('http://', adapter)
-        self._session_pool.mount('https://', adapter)
+        # 活跃下载信息按槽位存放（结构数组），每个下载独占一个槽位，
+        # 工作线程只写自己槽位的单个元素，无需加锁；数值列用array按原生类型连续存放。
+        # 空闲槽位队列同时充当并发准入闸门：调度线程阻塞等待空闲槽位，下载结束后归还
+        self._slot_task_id: List[Optional[str]] = [None] * max_concurrent_downloads
+        self._slot_url: List[str] = [''] * max_concurrent_downloads
+        self._slot_filepath: List[str] = [''] * max_concurrent_downloads
+        self._slot_downloaded = array('Q', [0]) * max_concurrent_downloads
+        self._slot_total = array('Q', [0]) * max_concurrent_downloads
+        self._slot_start = array('d', [0.0]) * max_concurrent_downloads
+        self._slot_speed = array('d', [0.0]) * max_concurrent_downloads
+        self._free_slots = queue.SimpleQueue()
+        for slot in range(max_concurrent_downloads):
+            self._free_slots.put(slot)
     
     def add_task(self, task: DownloadTask) -> str:
         """添加下载任务到优先级队列"""
-        self.download_queue.put(task)
+        self._enqueue(task, task.priority)
         return task.task_id
     
     def add_urgent_task(self, task: DownloadTask) -> str:
-        """添加紧急任务到队列前端"""
-        # 临时提高优先级
-        original_priority = task.priority
-        task.priority = DownloadPriority.URGENT
-        self.download_queue.put(task)
-        # 恢复原始优先级（用于后续统计）
-        task.priority = original_priority
+        """添加紧急任务到队列前端（直接放入紧急队列，不修改任务本身的优先级）"""
+        self._enqueue(task, DownloadPriority.URGENT)
         return task.task_id
     
+    def _enqueue(self, task: DownloadTask, priority: DownloadPriority):
+        """按指定优先级入队并唤醒调度线程"""
+        with self._completion_cv:
+            self._outstanding += 1
+        self._priority_queues[priority.value].put(task)
+        self._task_available.set()
+    
     def get_queue_status(self) -> Dict[str, int]:
         """获取队列状态"""
         return {
-            'queued_tasks': self.download_queue.qsize(),
-            'active_downloads': len(self.active_downloads),
+            'queued_tasks': self.get_queue_size(),
+            'active_downloads': self.get_active_count(),
             'completed_downloads': len(self.completed_downloads),
             'max_concurrent': self.max_concurrent_downloads
         }
     
     def get_active_downloads_info(self) -> List[Dict[str, any]]:
-        """获取活跃下载的详细信息"""
-        with self._lock:
-            active_info = []
-            for task_id, info in self.active_download_info.items():
-                active_info.append({
-                    'task_id': task_id,
-                    'url': info.get('url', ''),
-                    'filepath': info.get('filepath', ''),
-                    'downloaded_bytes': info.get('downloaded_bytes', 0),
-                    'total_bytes': info.get('total_bytes', 0),
-                    'progress': info.get('progress', 0.0),
-                    'start_time': info.get('start_time', 0),
-                    'elapsed_time': time.time() - info.get('start_time', time.time()),
-                    'speed': info.get('speed', 0.0)
-                })
-            return active_info
-    
-    def get_result(self, task_id: str) -> Optional[DownloadResult]:
-        """获取任务结果"""
-        return self.completed_downloads.get(task_id)
-    
-    def get_active_count(self) -> int:
-        """获取活跃下载数"""
-        return len(self.active_downloads)
-    
-    def get_queue_size(self) -> int:
-        """获取队列大小"""
-        return self.download_queue.qsize()
+        """获取活跃下载的详细信息（无锁读取槽位快照）"""
+        now = time.time()
+        active_info = []
+        for slot, task_id in enumerate(self._slot_task_id):
+            if task_id is None:
+                continue
+            downloaded_bytes = self._slot_downloaded[slot]
+            total_bytes = self._slot_total[slot]
+            start_time = self._slot_start[slot]
+            active_info.append({
+                'task_id': task_id,
+                'url': self._slot_url[slot],
+                'filepath': self._slot_filepath[slot],
+                'downloaded_bytes': downloaded_bytes,
+                'total_bytes': total_bytes,
+                'progress': downloaded_bytes / total_bytes if total_bytes > 0 else 0.0,
+                'start_time': start_time,
+                'elapsed_time': now - start_time,
+                'speed': self._slot_speed[slot]
+            })
+        return active_info
     
-    def _get_headers(self, url: str) -> Dict[str, str]:
-        """获取完整的浏览器请求头，用于避免403错误"""
-        from urllib.parse import urlparse
-        
-        # 解析URL以获取域名和Referer
-        parsed = urlparse(url)
-        base_url = f"{parsed.scheme}://{parsed.netloc}"
-        referer = base_url
+    def _get_headers(self, url: str) -> Mapping[str, str]:
+        """
+        获取完整的浏览器请求头，用于避免403错误
         
-        # 如果是M3U8或TS文件，尝试从路径推断Referer
-        if '.m3u8' in url or '.ts' in url:
-            # 尝试从路径中提取上级目录作为Referer
-            path_parts = parsed.path.split('/')
-            if len(path_parts) > 1:
-                referer = f"{base_url}/{'/'.join(path_parts[:-1])}/"
+        同一播放列表的片段共享目录，请求头按 Referer 缓存并以只读映射返回，
+        需要追加字段（如 Range）时请复制后再修改。
+        """
+        # 快速路径：直接切分字符串得到源站，避免每个片段都调用 urlparse
+        scheme_end = url.find('://')
+        if scheme_end < 0:
+            parsed = urlparse(url)
+            origin = f"{parsed.scheme}://{parsed.netloc}"
+            netloc_end = -1
+        else:
+            netloc_end = url.find('/', scheme_end + 3)
+            origin = url.partition('?')[0] if netloc_end < 0 else url[:netloc_end]
+        referer = origin
         
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Referer': referer,
-            'Accept': '*/*',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'Cache-Control': 'no-cache',
-            'Pragma': 'no-cache'
-        }
+        # 如果是M3U8或TS文件，使用所在目录作为Referer
+        if netloc_end >= 0 and ('.m3u8' in url or '.ts' in url):
+            referer = url.partition('?')[0].rpartition('/')[0] + '/'
         
+        headers = self._headers_cache.get(referer)
+        if headers is None:
+            headers = MappingProxyType(dict(_BASE_HEADERS, Referer=referer))
+            self._headers_cache[referer] = headers
         return headers
     
+    def _log(self, message: str):
+        """输出日志（仅入队，由日志线程异步调用回调）"""
+        if self.log_callback is None:
+            return
+        self._log_queue.put(message)
+        if self._log_thread is None:
+            with self._log_thread_lock:
+                if self._log_thread is None:
+                    self._log_thread = threading.Thread(target=self._log_drain_loop, daemon=True, name="dl-log")
+                    self._log_thread.start()
+    
+    def _log_drain_loop(self):
+        """日志线程 - 按入队顺序调用日志回调，空闲一段时间后自动退出，回调出错不影响下载流程"""
+        while True:
+            try:
+                message = self._log_queue.get(timeout=5.0)
+            except queue.Empty:
+                with self._log_thread_lock:
+                    if not self._log_queue.empty():
+                        continue
+                    self._log_thread = None
+                # _log 入队后不加锁读取 _log_thread，可能在上面清空前读到本线程而没有启动新线程，
+                # 这样的消息一定已在队列中：清空后再检查一次，有消息且没有新线程时继续处理
+                if self._log_queue.empty():
+                    return
+                with self._log_thread_lock:
+                    if self._log_thread is not None:
+                        return
+                    self._log_thread = threading.current_thread()
+                continue
+            callback = self.log_callback
+            if callback is None:
+                continue
+            try:
+                callback(message)
+            except Exception:
+                pass
+    
     def _log_http_response(self, task_id: str, url: str, response: requests.Response):
         """记录HTTP响应信息到日志"""
-        if not self.log_callback:
+        if self.log_callback is None:
             return
         
-        try:
-            # 提取片段编号（如果存在）
-            segment_num = ""
-            if "_segment_" in task_id:
-                try:
-                    segment_num = task_id.split("_segment_")[-1]
-                    segment_num = f"片段 {segment_num}"
-                except:
-                    segment_num = "片段"
-            
-            # 提取文件名（用于显示）
-            filename = url.split('/')[-1].split('?')[0] if '/' in url else url
-            if len(filename) > 40:
-                filename = filename[:37] + "..."
-            
-            # 记录HTTP响应状态码和基本信息
-            status_icon = "✅" if 200 <= response.status_code < 300 else "⚠️" if 300 <= response.status_code < 400 else "❌"
-            status_text = {
-                200: "OK",
-                206: "Partial Content",
-                301: "Moved Permanently",
-                302: "Found",
-                304: "Not Modified",
-                403: "Forbidden",
-                404: "Not Found",
-                416: "Range Not Satisfiable",
-                500: "Internal Server Error",
-                502: "Bad Gateway",
-                503: "Service Unavailable"
-            }.get(response.status_code, "Unknown")
-            
-            log_msg = f"{status_icon} [{segment_num}] HTTP {response.status_code} {status_text}"
-            if segment_num:
-                log_msg += f" - {filename}"
-            self.log_callback(log_msg)
-            
-            # 记录重要的响应头信息
-            important_headers = {
-                'content-length': '大小',
-                'content-type': '类型',
-                'content-range': '范围',
-                'accept-ranges': '支持范围',
-                'server': '服务器',
-                'cache-control': '缓存控制'
-            }
-            header_info = []
-            for header_name, display_name in important_headers.items():
-                header_value = response.headers.get(header_name)
-                if header_value:
-                    # 格式化content-length
-                    if header_name == 'content-length':
-                        try:
-                            size = int(header_value)
-                            if size < 1024:
-                                header_value = f"{size} B"
-                            elif size < 1024 * 1024:
-                                header_value = f"{size/1024:.2f} KB"
-                            else:
-                                header_value = f"{size/(1024*1024):.2f} MB"
-                        except:
-                            pass
-                    # 截断过长的值
-                    elif len(header_value) > 50:
-                        header_value = header_value[:47] + "..."
-                    header_info.append(f"{display_name}: {header_value}")
-            
-            if header_info:
-                self.log_callback(f"  📋 {', '.join(header_info)}")
-            
-            # 记录重定向信息
-            if response.history:
-                redirect_count = len(response.history)
-                final_url = response.url
-                if len(final_url) > 60:
-                    final_url = final_url[:57] + "..."
-                self.log_callback(f"  🔄 重定向 {redirect_count} 次 → {final_url}")
-            
-        except Exception as e:
-            # 静默处理日志记录错误，不影响下载流程
-            pass
+        # 提取片段编号（如果存在）
+        segment_num = _segment_label(task_id)
+        
+        # 提取文件名（用于显示）
+        filename = url.split('/')[-1].split('?')[0] if '/' in url else url
+        if len(filename) > 40:
+            filename = filename[:37] + "..."
+        
+        # 记录HTTP响应状态码和基本信息
+        status_code = response.status_code
+        status_icon = "✅" if 200 <= status_code < 300 else "⚠️" if 300 <= status_code < 400 else "❌"
+        status_text = _STATUS_TEXT.get(status_code, "Unknown")
+        
+        log_msg = f"{status_icon} [{segment_num}] HTTP {status_code} {status_text}"
+        if segment_num:
+            log_msg += f" - {filename}"
+        self._log(log_msg)
+        
+        # 响应头和重定向信息只在详细日志模式下记录
+        if self._log_verbosity < 2:
+            return
+        
+        # 记录重要的响应头信息
+        header_info = []
+        for header_name, display_name in _IMPORTANT_HEADERS:
+            header_value = response.headers.get(header_name)
+            if header_value:
+                # 格式化content-length
+                if header_name == 'content-length':
+                    try:
+                        size = int(header_value)
+                    except ValueError:
+                        pass
+                    else:
+                        header_value = _format_size(size)
+                # 截断过长的值
+                elif len(header_value) > 50:
+                    header_value = header_value[:47] + "..."
+                header_info.append(f"{display_name}: {header_value}")
+        
+        if header_info:
+            self._log(f"  📋 {', '.join(header_info)}")
+        
+        # 记录重定向信息
+        if response.history:
+            redirect_count = len(response.history)
+            final_url = response.url
+            if len(final_url) > 60:
+                final_url = final_url[:57] + "..."
+            self._log(f"  🔄 重定向 {redirect_count} 次 → {final_url}")
 
-    def record_task_completion(self, success: bool, download_time: float, downloaded_bytes: int):
-        """记录任务完成统计"""
+    def record_task_completion(self, success: bool, download_time: float, downloaded_bytes: int,
+                               total_bytes: int = 0):
+        """记录任务完成统计（只有写入方加锁）"""
+        # 峰值并发数在锁外统计，缩短临界区
+        current_active = self.get_active_count()
         with self._lock:
             self._total_tasks += 1
             if success:
@@ -440,149 +710,191 @@ class SmartDownloadScheduler:
                 self._failed_tasks += 1
             self._total_download_time += download_time
             self._total_downloaded_bytes += downloaded_bytes
+            self._total_expected_bytes += total_bytes
             
             # 更新峰值并发数
-            current_active = len(self.active_downloads)
             if current_active > self._peak_concurrent_downloads:
                 self._peak_concurrent_downloads = current_active
     
     def get_performance_stats(self) -> Dict[str, float]:
-        """获取性能统计信息"""
-        with self._lock:
-            success_rate = (self._successful_tasks / self._total_tasks * 100) if self._total_tasks > 0 else 0
-            avg_download_time = (self._total_download_time / self._total_tasks) if self._total_tasks > 0 else 0
-            avg_download_speed = (self._total_downloaded_bytes / self._total_download_time / 1024 / 1024) if self._total_download_time > 0 else 0
-            
-            return {
-                'total_tasks': self._total_tasks,
-                'successful_tasks': self._successful_tasks,
-                'failed_tasks': self._failed_tasks,
-                'success_rate': success_rate,
-                'average_download_time': avg_download_time,
-                'average_download_speed_mbps': avg_download_speed,
-                'peak_concurrent_downloads': self._peak_concurrent_downloads,
-                'current_active_downloads': len(self.active_downloads)
-            }
+        """获取性能统计信息 - 无锁读取，各计数器可能相差一次更新，对统计展示可以接受"""
+        total_tasks = self._total_tasks
+        successful_tasks = self._successful_tasks
+        total_download_time = self._total_download_time
+        total_downloaded_bytes = self._total_downloaded_bytes
+        
+        success_rate = (successful_tasks / total_tasks * 100) if total_tasks > 0 else 0
+        avg_download_time = (total_download_time / total_tasks) if total_tasks > 0 else 0
+        avg_download_speed = (total_downloaded_bytes / total_download_time / 1024 / 1024) if total_download_time > 0 else 0
+        
+        return {
+            'total_tasks': total_tasks,
+            'successful_tasks': successful_tasks,
+            'failed_tasks': self._failed_tasks,
+            'success_rate': success_rate,
+            'average_download_time': avg_download_time,
+            'average_download_speed_mbps': avg_download_speed,
+            'peak_concurrent_downloads': self._peak_concurrent_downloads,
+            'current_active_downloads': self.get_active_count()
+        }
+    
+    def wait_until_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待所有任务结束（队列为空且没有活跃下载）或调度器停止
+        
+        每个任务结束时被唤醒重新检查，而不是定时轮询
+        
+        Returns:
+            是否已空闲或已停止，超时返回False
+        """
+        with self._completion_cv:
+            return self._completion_cv.wait_for(self._is_idle_or_stopped, timeout)
+    
+    def _is_idle_or_stopped(self) -> bool:
+        # 不用 队列长度 + 活跃槽位数 判断：调度线程取出任务到写入槽位之间，两者都为0
+        return self._stop_event.is_set() or self._outstanding == 0
+    
+    def get_completion_counters(self) -> Tuple[int, int, int, int]:
+        """
+        获取完成计数（无锁读取，O(1)）
+        
+        Returns:
+            (已结束任务数, 成功任务数, 已下载字节数, 文件总字节数)
+        """
+        return (self._total_tasks, self._successful_tasks,
+                self._total_downloaded_bytes, self._total_expected_bytes)
     
     def clear_queue(self):
         """清空等待队列（不影响正在进行的下载）"""
         cleared_count = 0
-        while not self.download_queue.empty():
-            try:
-                self.download_queue.get_nowait()
+        for pq in self._priority_queues:
+            while True:
+                try:
+                    pq.get_nowait()
+                except queue.Empty:
+                    break
                 cleared_count += 1
-            except queue.Empty:
-                break
+        if cleared_count:
+            with self._completion_cv:
+                self._outstanding -= cleared_count
+                self._completion_cv.notify_all()
         return cleared_count
     
     def start(self):
         """启动调度器"""
         if self._scheduler_thread is None or not self._scheduler_thread.is_alive():
             self._stop_event.clear()
+            if self._executor is None:
+                # 下载基于同步的requests，每个并发下载占用一个常驻工作线程；
+                # 阻塞在socket读写时会释放GIL，线程按需创建且数量不超过max_concurrent_downloads
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrent_downloads,
+                    thread_name_prefix="dl"
+                )
             self._scheduler_thread = threading.Thread(target=self._schedule_loop, daemon=True)
             self._scheduler_thread.start()
     
     def stop(self):
         """停止调度器"""
         self._stop_event.set()
+        # 唤醒可能在等待空闲槽位或新任务的调度线程
+        self._free_slots.put(None)
+        self._task_available.set()
+        with self._completion_cv:
+            self._completion_cv.notify_all()
         if self._scheduler_thread:
             self._scheduler_thread.join(timeout=5.0)
+        # 调度线程退出后不会再提交任务，关闭线程池（正在进行的下载会继续完成）
+        if self._executor and not (self._scheduler_thread and self._scheduler_thread.is_alive()):
+            self._executor.shutdown(wait=False)
+            self._executor = None
     
     def _schedule_loop(self):
-        """调度循环"""
+        """调度循环 - 阻塞等待空闲槽位和新任务，无轮询休眠"""
         while not self._stop_event.is_set():
             try:
-                # 检查是否有可用槽位
-                with self._lock:
-                    available_slots = self.max_concurrent_downloads - len(self.active_downloads)
+                # 等待空闲槽位（None 为 stop() 放入的唤醒标记）
+                slot = self._free_slots.get()
+                if slot is None:
+                    continue
                 
-                if available_slots > 0 and not self.download_queue.empty():
-                    # 获取下一个高优先级任务
-                    try:
-                        task = self.download_queue.get(timeout=1.0)
-                        # 启动下载线程
-                        thread = threading.Thread(
-                            target=self._download_worker,
-                            args=(task,),
-                            daemon=True
-                        )
-                        thread.start()
-                        
-                        with self._lock:
-                            self.active_downloads[task.task_id] = thread
-                            
-                        # 记录线程启动信息
-                        if self.log_callback:
-                            try:
-                                active_count = len(self.active_downloads)
-                                queue_size = self.download_queue.qsize()
-                                self.log_callback(f"  📊 活跃下载: {active_count}/{self.max_concurrent_downloads}, 队列剩余: {queue_size}")
-                            except:
-                                pass
-                            
-                    except queue.Empty:
-                        continue
+                # 等待下一个高优先级任务，add_task/stop 会置位事件唤醒调度线程
+                task = None
+                while not self._stop_event.is_set():
+                    task = self._next_task()
+                    if task is not None:
+                        break
+                    # 先清除事件再检查一次，避免与 add_task 竞争丢失唤醒
+                    self._task_available.clear()
+                    task = self._next_task()
+                    if task is not None:
+                        break
+                    self._task_available.wait()
+                if task is None:
+                    self._free_slots.put(slot)
+                    break
                 
-                # 清理已完成的下载
-                self._cleanup_completed_downloads()
+                # 占用槽位并初始化下载信息，最后写入task_id表示槽位生效
+                self._slot_url[slot] = task.url
+                self._slot_filepath[slot] = task.filepath
+                self._slot_downloaded[slot] = 0
+                self._slot_total[slot] = 0
+                self._slot_start[slot] = time.time()
+                self._slot_speed[slot] = 0.0
+                self._slot_task_id[slot] = task.task_id
                 
-                time.sleep(0.1)  # 短暂休眠避免CPU占用过高
+                # 提交到常驻线程池，避免每个片段创建新线程
+                self._executor.submit(self._download_worker_wrapped, task, slot)
+                    
+                # 记录线程启动信息
+                if self.log_callback is not None:
+                    active_count = self.get_active_count()
+                    queue_size = self.get_queue_size()
+                    self._log(f"  📊 活跃下载: {active_count}/{self.max_concurrent_downloads}, 队列剩余: {queue_size}")
                 
             except Exception as e:
                 print(f"调度循环出错: {e}")
                 time.sleep(1.0)
     
-    def _cleanup_completed_downloads(self):
-        """清理已完成的下载"""
-        completed_tasks = []
-        
-        with self._lock:
-            for task_id, thread in list(self.active_downloads.items()):
-                if not thread.is_alive():
-                    completed_tasks.append(task_id)
-            
-            for task_id in completed_tasks:
-                del self.active_downloads[task_id]
+    def _next_task(self) -> Optional[DownloadTask]:
+        """按优先级从高到低取出下一个任务，队列全空时返回None"""
+        for pq in reversed(self._priority_queues):
+            try:
+                return pq.get_nowait()
+            except queue.Empty:
+                pass
+        return None
     
-    def _download_worker(self, task: DownloadTask):
+    def _download_worker_wrapped(self, task: DownloadTask, slot: int):
+        """执行下载并在结束后归还槽位"""
+        try:
+            self._download_worker(task, slot)
+        finally:
+            self._slot_task_id[slot] = None
+            self._free_slots.put(slot)
+            # 槽位释放后才把任务计为结束并通知等待方
+            with self._completion_cv:
+                self._outstanding -= 1
+                self._completion_cv.notify_all()
+    
+    def _download_worker(self, task: DownloadTask, slot: int):
         """下载工作线程 - 增强错误处理和重试机制"""
         start_time = time.time()
         task_id = task.task_id
         
-        # 初始化下载信息
-        with self._lock:
-            self.active_download_info[task_id] = {
-                'url': task.url,
-                'filepath': task.filepath,
-                'downloaded_bytes': 0,
-                'total_bytes': 0,
-                'progress': 0.0,
-                'start_time': time.time(),
-                'speed': 0.0
-            }
-        
-        # 记录下载开始日志
-        if self.log_callback:
-            try:
-                # 提取片段编号
-                segment_num = ""
-                if "_segment_" in task_id:
-                    try:
-                        segment_num = task_id.split("_segment_")[-1]
-                        segment_num = f"片段 {segment_num}"
-                    except:
-                        segment_num = "片段"
-                
-                filename = os.path.basename(task.filepath)
-                url_short = task.url.split('?')[0]
-                if len(url_short) > 60:
-                    url_short = url_short[:57] + "..."
-                
-                self.log_callback(f"🚀 [{segment_num}] 开始下载: {filename}")
-                self.log_callback(f"  📍 URL: {url_short}")
-                self.log_callback(f"  💾 保存路径: {task.filepath}")
-            except:
-                pass
+        # 未设置日志回调时跳过所有日志字符串的构造；片段编号和文件名只计算一次
+        logging_enabled = self.log_callback is not None
+        if logging_enabled:
+            segment_num = _segment_label(task_id)
+            filename = os.path.basename(task.filepath)
+            url_short = task.url.split('?')[0]
+            if len(url_short) > 60:
+                url_short = url_short[:57] + "..."
+            
+            # 记录下载开始日志
+            self._log(f"🚀 [{segment_num}] 开始下载: {filename}")
+            self._log(f"  📍 URL: {url_short}")
+            self._log(f"  💾 保存路径: {task.filepath}")
         
         result = DownloadResult(
             task=task,
@@ -594,32 +906,18 @@ class SmartDownloadScheduler:
         
         # 重试机制
         for attempt in range(task.retry_count + 1):
-            if attempt > 0 and self.log_callback:
-                try:
-                    segment_num = ""
-                    if "_segment_" in task_id:
-                        try:
-                            segment_num = task_id.split("_segment_")[-1]
-                            segment_num = f"片段 {segment_num}"
-                        except:
-                            segment_num = "片段"
-                    self.log_callback(f"🔄 [{segment_num}] 第 {attempt + 1} 次重试下载...")
-                except:
-                    pass
+            if attempt > 0 and logging_enabled:
+                self._log(f"🔄 [{segment_num}] 第 {attempt + 1} 次重试下载...")
             try:
                 # 执行下载
-                success, downloaded_bytes, total_bytes = self._perform_download(task)
+                success, downloaded_bytes, total_bytes = self._perform_download(task, slot)
                 
                 # 更新下载进度信息
-                with self._lock:
-                    if task_id in self.active_download_info:
-                        self.active_download_info[task_id]['downloaded_bytes'] = downloaded_bytes
-                        self.active_download_info[task_id]['total_bytes'] = total_bytes
-                        if total_bytes > 0:
-                            self.active_download_info[task_id]['progress'] = downloaded_bytes / total_bytes
-                        elapsed = time.time() - start_time
-                        if elapsed > 0:
-                            self.active_download_info[task_id]['speed'] = downloaded_bytes / elapsed
+                self._slot_downloaded[slot] = downloaded_bytes
+                self._slot_total[slot] = total_bytes
+                elapsed = time.time() - start_time
+                if elapsed > 0:
+                    self._slot_speed[slot] = downloaded_bytes / elapsed
                 
                 if success:
                     result.success = True
@@ -628,44 +926,25 @@ class SmartDownloadScheduler:
                     result.download_time = time.time() - start_time
                     
                     # 记录下载成功日志
-                    if self.log_callback:
-                        try:
-                            segment_num = ""
-                            if "_segment_" in task_id:
-                                try:
-                                    segment_num = task_id.split("_segment_")[-1]
-                                    segment_num = f"片段 {segment_num}"
-                                except:
-                                    segment_num = "片段"
-                            
-                            filename = os.path.basename(task.filepath)
-                            elapsed = result.download_time
-                            speed = downloaded_bytes / elapsed if elapsed > 0 else 0
-                            
-                            if speed < 1024:
-                                speed_str = f"{speed:.2f} B/s"
-                            elif speed < 1024 * 1024:
-                                speed_str = f"{speed/1024:.2f} KB/s"
-                            else:
-                                speed_str = f"{speed/(1024*1024):.2f} MB/s"
-                            
-                            if total_bytes < 1024:
-                                size_str = f"{total_bytes} B"
-                            elif total_bytes < 1024 * 1024:
-                                size_str = f"{total_bytes/1024:.2f} KB"
-                            else:
-                                size_str = f"{total_bytes/(1024*1024):.2f} MB"
-                            
-                            self.log_callback(f"✅ [{segment_num}] 下载完成: {filename}")
-                            self.log_callback(f"  📦 大小: {size_str}, 耗时: {elapsed:.2f}秒, 速度: {speed_str}")
-                        except:
-                            pass
+                    if logging_enabled:
+                        elapsed = result.download_time
+                        speed = downloaded_bytes / elapsed if elapsed > 0 else 0
+                        
+                        if speed < 1024:
+                            speed_str = f"{speed:.2f} B/s"
+                        elif speed < 1024 * 1024:
+                            speed_str = f"{speed/1024:.2f} KB/s"
+                        else:
+                            speed_str = f"{speed/(1024*1024):.2f} MB/s"
+                        
+                        self._log(f"✅ [{segment_num}] 下载完成: {filename}")
+                        self._log(f"  📦 大小: {_format_size(total_bytes)}, 耗时: {elapsed:.2f}秒, 速度: {speed_str}")
                     break
                 else:
                     # 下载失败，记录错误信息
                     if attempt < task.retry_count:
-                        wait_time = 2 ** attempt  # 指数退避
-                        print(f"🔄 任务 {task.task_id} 第{attempt + 1}次下载失败，{wait_time}秒后重试")
+                        wait_time = _backoff_delay(attempt)
+                        _console_print(f"🔄 任务 {task.task_id} 第{attempt + 1}次下载失败，{wait_time:.1f}秒后重试")
                         time.sleep(wait_time)
                         result.error_message = f"下载失败，正在第{attempt + 2}次重试"
                     else:
@@ -674,8 +953,8 @@ class SmartDownloadScheduler:
             except requests.exceptions.RequestException as e:
                 # 网络相关错误
                 if attempt < task.retry_count:
-                    wait_time = 2 ** attempt
-                    print(f"🌐 任务 {task.task_id} 网络错误: {e}，{wait_time}秒后重试")
+                    wait_time = _backoff_delay(attempt)
+                    _console_print(f"🌐 任务 {task.task_id} 网络错误: {e}，{wait_time:.1f}秒后重试")
                     time.sleep(wait_time)
                     result.error_message = f"网络错误: {e}"
                 else:
@@ -684,43 +963,28 @@ class SmartDownloadScheduler:
             except IOError as e:
                 # 文件I/O错误
                 result.error_message = f"文件I/O错误: {e}"
-                print(f"💾 任务 {task.task_id} 文件I/O错误: {e}")
+                _console_print(f"💾 任务 {task.task_id} 文件I/O错误: {e}")
                 break  # I/O错误通常不可恢复，不再重试
                 
             except Exception as e:
                 # 其他未知错误
                 result.error_message = f"未知错误: {e}"
-                print(f"❌ 任务 {task.task_id} 未知错误: {e}")
+                _console_print(f"❌ 任务 {task.task_id} 未知错误: {e}")
                 if attempt < task.retry_count:
                     time.sleep(1)
                 
         # 记录结果
         result.download_time = time.time() - start_time
-        with self._lock:
-            self.completed_downloads[task_id] = result
-            # 清理活跃下载信息
-            if task_id in self.active_download_info:
-                del self.active_download_info[task_id]
-            # 记录任务完成统计
-            self.record_task_completion(result.success, result.download_time, result.downloaded_bytes)
+        self.completed_downloads[task_id] = result
+        # 记录任务完成统计
+        self.record_task_completion(result.success, result.download_time, result.downloaded_bytes,
+                                    result.total_bytes)
         
         # 如果最终失败，记录失败日志
-        if not result.success and self.log_callback:
-            try:
-                segment_num = ""
-                if "_segment_" in task_id:
-                    try:
-                        segment_num = task_id.split("_segment_")[-1]
-                        segment_num = f"片段 {segment_num}"
-                    except:
-                        segment_num = "片段"
-                
-                filename = os.path.basename(task.filepath)
-                error_msg = result.error_message or "未知错误"
-                self.log_callback(f"❌ [{segment_num}] 下载失败: {filename}")
-                self.log_callback(f"  ⚠️ 错误: {error_msg}")
-            except:
-                pass
+        if not result.success and logging_enabled:
+            error_msg = result.error_message or "未知错误"
+            self._log(f"❌ [{segment_num}] 下载失败: {filename}")
+            self._log(f"  ⚠️ 错误: {error_msg}")
             
             # 更新全局统计
             batch_downloader = get_batch_downloader()
@@ -733,27 +997,34 @@ class SmartDownloadScheduler:
                 batch_downloader._total_download_time += result.download_time
                 batch_downloader._total_downloaded_bytes += result.downloaded_bytes
     
-    def _perform_download(self, task: DownloadTask) -> Tuple[bool, int, int]:
+    def _perform_download(self, task: DownloadTask, slot: Optional[int] = None) -> Tuple[bool, int, int]:
         """执行实际下载 - 增强错误处理和断点续传"""
         temp_filepath = task.filepath + ".tmp"
         downloaded_bytes = 0
+        response = None
         
         try:
-            # 检查是否已存在
-            if os.path.exists(task.filepath):
-                file_size = os.path.getsize(task.filepath)
-                print(f"✅ 文件已存在: {task.filepath} ({file_size} bytes)")
+            # 检查是否已存在（一次 stat 同时得到存在性和大小）
+            try:
+                file_size = os.stat(task.filepath).st_size
+            except FileNotFoundError:
+                pass
+            else:
+                _console_print(f"✅ 文件已存在: {task.filepath} ({file_size} bytes)")
                 return True, file_size, file_size
             
             # 检查临时文件（断点续传）
-            if os.path.exists(temp_filepath):
-                downloaded_bytes = os.path.getsize(temp_filepath)
-                print(f"🔄 检测到断点续传: {temp_filepath} ({downloaded_bytes} bytes)")
+            try:
+                downloaded_bytes = os.stat(temp_filepath).st_size
+            except FileNotFoundError:
+                pass
+            else:
+                _console_print(f"🔄 检测到断点续传: {temp_filepath} ({downloaded_bytes} bytes)")
             
             # 设置请求头 - 添加更多浏览器请求头以避免403错误
             headers = self._get_headers(task.url)
             if downloaded_bytes > 0:
-                headers['Range'] = f'bytes={downloaded_bytes}-'
+                headers = dict(headers, Range=f'bytes={downloaded_bytes}-')
             
             # 执行请求，带重试机制
             max_attempts = 3
@@ -774,40 +1045,44 @@ class SmartDownloadScheduler:
                     if response.status_code == 200:
                         # 全新下载
                         if downloaded_bytes > 0:
-                            print(f"⚠️ 服务器不支持断点续传，重新开始下载")
+                            _console_print(f"⚠️ 服务器不支持断点续传，重新开始下载")
                             downloaded_bytes = 0
                         break
                     elif response.status_code == 206:
                         # 断点续传成功
-                        print(f"✅ 断点续传成功: {downloaded_bytes} bytes")
+                        _console_print(f"✅ 断点续传成功: {downloaded_bytes} bytes")
                         break
                     elif response.status_code == 416:
-                        # 范围请求无效，文件可能已完整
-                        if os.path.exists(temp_filepath):
-                            os.rename(temp_filepath, task.filepath)
-                            file_size = os.path.getsize(task.filepath)
-                            print(f"✅ 文件已完整: {task.filepath} ({file_size} bytes)")
-                            return True, file_size, file_size
-                        else:
+                        # 范围请求无效，文件可能已完整（一次 stat 同时得到存在性和大小）
+                        try:
+                            file_size = os.stat(temp_filepath).st_size
+                        except FileNotFoundError:
                             downloaded_bytes = 0
                             break
+                        _discard_body(response)
+                        os.replace(temp_filepath, task.filepath)
+                        _console_print(f"✅ 文件已完整: {task.filepath} ({file_size} bytes)")
+                        return True, file_size, file_size
                     elif response.status_code == 404:
-                        print(f"❌ 文件不存在: {task.url}")
+                        _console_print(f"❌ 文件不存在: {task.url}")
+                        _discard_body(response)
                         return False, 0, 0
                     else:
+                        if response.status_code >= 400:
+                            _discard_body(response)
                         response.raise_for_status()
                         break
                         
                 except requests.exceptions.Timeout:
                     if attempt < max_attempts - 1:
-                        print(f"⏰ 请求超时，第{attempt + 2}次重试...")
-                        time.sleep(2 ** attempt)
+                        _console_print(f"⏰ 请求超时，第{attempt + 2}次重试...")
+                        time.sleep(_backoff_delay(attempt))
                     else:
                         raise
                 except requests.exceptions.ConnectionError as e:
                     if attempt < max_attempts - 1:
-                        print(f"🔌 连接错误，第{attempt + 2}次重试...")
-                        time.sleep(2 ** attempt)
+                        _console_print(f"🔌 连接错误，第{attempt + 2}次重试...")
+                        time.sleep(_backoff_delay(attempt))
                     else:
                         raise
             
@@ -816,157 +1091,169 @@ class SmartDownloadScheduler:
             total_bytes = int(content_length) + downloaded_bytes if content_length else 0
             
             # 记录下载信息到日志
-            if self.log_callback:
-                try:
-                    segment_num = ""
-                    if "_segment_" in task.task_id:
-                        try:
-                            segment_num = task.task_id.split("_segment_")[-1]
-                            segment_num = f"片段 {segment_num}"
-                        except:
-                            segment_num = "片段"
-                    
-                    if total_bytes > 0:
-                        if total_bytes < 1024:
-                            size_str = f"{total_bytes} B"
-                        elif total_bytes < 1024 * 1024:
-                            size_str = f"{total_bytes/1024:.2f} KB"
-                        else:
-                            size_str = f"{total_bytes/(1024*1024):.2f} MB"
-                        
-                        if downloaded_bytes > 0:
-                            self.log_callback(f"  📊 [{segment_num}] 文件大小: {size_str}, 已下载: {downloaded_bytes} bytes (断点续传)")
-                        else:
-                            self.log_callback(f"  📊 [{segment_num}] 文件大小: {size_str}")
-                    else:
-                        self.log_callback(f"  📊 [{segment_num}] 文件大小: 未知")
-                except:
-                    pass
+            if self.log_callback is not None:
+                segment_num = _segment_label(task.task_id)
+                if total_bytes <= 0:
+                    self._log(f"  📊 [{segment_num}] 文件大小: 未知")
+                elif downloaded_bytes > 0:
+                    self._log(f"  📊 [{segment_num}] 文件大小: {_format_size(total_bytes)}, 已下载: {downloaded_bytes} bytes (断点续传)")
+                else:
+                    self._log(f"  📊 [{segment_num}] 文件大小: {_format_size(total_bytes)}")
             
             # 根据内存优化模式选择合适的下载策略
+            # 注意：临时文件不做预分配（posix_fallocate会直接改变文件长度），
+            # 断点续传依赖"临时文件大小 == 已下载字节数"这一前提
             if task.memory_efficient and total_bytes > 10 * 1024 * 1024:  # 大于10MB使用内存优化
                 success, downloaded_bytes = self._memory_efficient_download(response, temp_filepath, 
                                                                           downloaded_bytes, task.chunk_size,
-                                                                          task.task_id, total_bytes)
+                                                                          slot, total_bytes)
             else:
                 success, downloaded_bytes = self._standard_download(response, temp_filepath, 
                                                               downloaded_bytes, task.chunk_size,
-                                                              task.task_id, total_bytes)
+                                                              slot, total_bytes)
             
-            # 重命名临时文件
-            if success and os.path.exists(temp_filepath):
-                os.rename(temp_filepath, task.filepath)
-                print(f"✅ 下载完成: {task.filepath} ({downloaded_bytes} bytes)")
+            # 重命名临时文件（os.replace 在目标已存在时也能原子覆盖，包括Windows）
+            if success:
+                try:
+                    os.replace(temp_filepath, task.filepath)
+                except FileNotFoundError:
+                    success = False
+            if success:
+                _console_print(f"✅ 下载完成: {task.filepath} ({downloaded_bytes} bytes)")
                 return True, downloaded_bytes, total_bytes or downloaded_bytes
             else:
-                print(f"❌ 下载失败: {task.url}")
+                _console_print(f"❌ 下载失败: {task.url}")
                 return False, downloaded_bytes, 0
             
         except requests.exceptions.RequestException as e:
-            print(f"🌐 网络错误 - 任务 {task.task_id}: {e}")
+            _console_print(f"🌐 网络错误 - 任务 {task.task_id}: {e}")
             return False, downloaded_bytes, 0
         except IOError as e:
-            print(f"💾 文件I/O错误 - 任务 {task.task_id}: {e}")
+            _console_print(f"💾 文件I/O错误 - 任务 {task.task_id}: {e}")
             return False, downloaded_bytes, 0
         except Exception as e:
-            print(f"❌ 未知错误 - 任务 {task.task_id}: {e}")
+            _console_print(f"❌ 未知错误 - 任务 {task.task_id}: {e}")
             return False, downloaded_bytes, 0
+        finally:
+            # 任何路径都关闭响应，使连接归还共享连接池以便后续片段复用
+            if response is not None:
+                response.close()
     
     def _standard_download(self, response, temp_filepath: str, downloaded_bytes: int, chunk_size: int, 
-                          task_id: str = None, total_bytes: int = 0) -> Tuple[bool, int]:
+                          slot: Optional[int] = None, total_bytes: int = 0) -> Tuple[bool, int]:
         """标准下载模式 - 支持实时进度更新"""
         try:
             mode = 'ab' if downloaded_bytes > 0 else 'wb'
             start_time = time.time()
             last_update_time = start_time
+            last_update_bytes = downloaded_bytes
             update_interval = 0.5  # 每0.5秒更新一次进度
+            max_read_size = max(chunk_size, _MAX_READ_SIZE)
             
-            with open(temp_filepath, mode) as f:
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded_bytes += len(chunk)
+            # 直接从底层连接读取，绕过 iter_content 的生成器开销。
+            # 不改用 readinto：urllib3 的 readinto 内部同样是 read 后再拷贝；
+            # 也不能关闭 decode_content，否则 gzip 传输的片段会以压缩形式落盘
+            raw = response.raw
+            raw.decode_content = True
+            
+            with open(temp_filepath, mode, buffering=_WRITE_BUFFER_SIZE) as f:
+                while True:
+                    chunk = raw.read(chunk_size)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    downloaded_bytes += len(chunk)
+                    
+                    current_time = time.time()
+                    if current_time - last_update_time >= update_interval:
+                        # 按最近一个统计窗口的速度调整单次读取大小
+                        window_speed = (downloaded_bytes - last_update_bytes) / (current_time - last_update_time)
+                        if window_speed > _FAST_LINK_SPEED and chunk_size < max_read_size:
+                            chunk_size = min(chunk_size * 2, max_read_size)
+                        elif window_speed < _SLOW_LINK_SPEED and chunk_size > _MIN_READ_SIZE:
+                            chunk_size = max(chunk_size // 2, _MIN_READ_SIZE)
                         
-                        # 定期更新进度信息
-                        current_time = time.time()
-                        if task_id and (current_time - last_update_time >= update_interval):
+                        # 定期更新进度信息，只写本任务独占的槽位，无需加锁
+                        if slot is not None:
                             elapsed = current_time - start_time
-                            speed = downloaded_bytes / elapsed if elapsed > 0 else 0
-                            
-                            with self._lock:
-                                if task_id in self.active_download_info:
-                                    self.active_download_info[task_id]['downloaded_bytes'] = downloaded_bytes
-                                    if total_bytes > 0:
-                                        self.active_download_info[task_id]['total_bytes'] = total_bytes
-                                        self.active_download_info[task_id]['progress'] = downloaded_bytes / total_bytes
-                                    self.active_download_info[task_id]['speed'] = speed
-                            
-                            last_update_time = current_time
+                            self._slot_downloaded[slot] = downloaded_bytes
+                            if total_bytes > 0:
+                                self._slot_total[slot] = total_bytes
+                            self._slot_speed[slot] = downloaded_bytes / elapsed if elapsed > 0 else 0
+                        
+                        last_update_time = current_time
+                        last_update_bytes = downloaded_bytes
                             
             return True, downloaded_bytes
         except Exception as e:
-            print(f"标准下载失败: {e}")
+            _console_print(f"标准下载失败: {e}")
             return False, downloaded_bytes
     
     def _memory_efficient_download(self, response, temp_filepath: str, downloaded_bytes: int, chunk_size: int,
-                                   task_id: str = None, total_bytes: int = 0) -> Tuple[bool, int]:
+                                   slot: Optional[int] = None, total_bytes: int = 0) -> Tuple[bool, int]:
         """内存优化下载模式 - 适用于大文件，支持实时进度更新"""
         try:
             mode = 'ab' if downloaded_bytes > 0 else 'wb'
-            write_count = 0
             start_time = time.time()
             last_update_time = start_time
             update_interval = 0.5  # 每0.5秒更新一次进度
             
+            raw = response.raw
+            raw.decode_content = True
+            
+            # 保留默认的缓冲文件对象：超过其内部缓冲区的写入会直接下发为一次write系统调用，
+            # 同时保证数据写满，不必像 buffering=0 那样自行处理短写
             with open(temp_filepath, mode) as f:
-                chunk_buffer = []
-                buffer_size = 0
+                # 从缓冲区池取固定缓冲区，数据直接拷入其中，避免每个片段都新建大对象
                 max_buffer_size = chunk_size * 10  # 最大缓冲区大小
+                buffer = self._buffer_pool.acquire(max_buffer_size)
+                view = memoryview(buffer)
+                buffer_size = 0
                 
-                for chunk in response.iter_content(chunk_size=chunk_size):
-                    if chunk:
-                        chunk_buffer.append(chunk)
-                        buffer_size += len(chunk)
-                        downloaded_bytes += len(chunk)
-                        
+                try:
+                    while True:
+                        chunk = raw.read(chunk_size)
+                        if not chunk:
+                            break
+                        chunk_len = len(chunk)
+                        downloaded_bytes += chunk_len
+                    
+                        # 缓冲区放不下时先写入文件
+                        if buffer_size + chunk_len > max_buffer_size:
+                            f.write(view[:buffer_size])
+                            buffer_size = 0
+                    
+                        if chunk_len > max_buffer_size:
+                            # 解压后的数据可能超过缓冲区，直接写入
+                            f.write(chunk)
+                        else:
+                            view[buffer_size:buffer_size + chunk_len] = chunk
+                            buffer_size += chunk_len
+                    
                         # 定期更新进度信息
                         current_time = time.time()
-                        if task_id and (current_time - last_update_time >= update_interval):
+                        if slot is not None and (current_time - last_update_time >= update_interval):
                             elapsed = current_time - start_time
-                            speed = downloaded_bytes / elapsed if elapsed > 0 else 0
-                            
-                            with self._lock:
-                                if task_id in self.active_download_info:
-                                    self.active_download_info[task_id]['downloaded_bytes'] = downloaded_bytes
-                                    if total_bytes > 0:
-                                        self.active_download_info[task_id]['total_bytes'] = total_bytes
-                                        self.active_download_info[task_id]['progress'] = downloaded_bytes / total_bytes
-                                    self.active_download_info[task_id]['speed'] = speed
-                            
-                            last_update_time = current_time
                         
-                        # 当缓冲区达到一定大小时写入文件
-                        if buffer_size >= max_buffer_size:
-                            f.write(b''.join(chunk_buffer))
-                            chunk_buffer.clear()
-                            buffer_size = 0
-                            write_count += 1
-                            
-                            # 定期刷新文件缓冲区
-                            if write_count % 10 == 0:
-                                f.flush()
-                                os.fsync(f.fileno())
+                            # 只写本任务独占的槽位，无需加锁
+                            self._slot_downloaded[slot] = downloaded_bytes
+                            if total_bytes > 0:
+                                self._slot_total[slot] = total_bytes
+                            self._slot_speed[slot] = downloaded_bytes / elapsed if elapsed > 0 else 0
+                        
+                            last_update_time = current_time
                 
-                # 写入剩余数据
-                if chunk_buffer:
-                    f.write(b''.join(chunk_buffer))
-                    f.flush()
-                    os.fsync(f.fileno())
+                    # 写入剩余数据
+                    if buffer_size:
+                        f.write(view[:buffer_size])
+                finally:
+                    view.release()
+                    self._buffer_pool.release(buffer)
             
             return True, downloaded_bytes
             
         except Exception as e:
-            print(f"内存优化下载失败: {e}")
+            _console_print(f"内存优化下载失败: {e}")
             return False, downloaded_bytes
     
     def get_result(self, task_id: str) -> Optional[DownloadResult]:
@@ -976,19 +1263,19 @@ class SmartDownloadScheduler:
     
     def get_active_count(self) -> int:
         """获取活跃下载数"""
-        with self._lock:
-            return len(self.active_downloads)
+        return sum(1 for task_id in self._slot_task_id if task_id is not None)
     
     def get_queue_size(self) -> int:
         """获取队列大小"""
-        return self.download_queue.qsize()
+        return sum(pq.qsize() for pq in self._priority_queues)
 
 
 class BatchDownloader:
     """批量下载管理器 - 管理多个下载任务"""
     
     def __init__(self, max_concurrent_tasks: int = 3, max_concurrent_downloads_per_task: int = 10, 
-                 log_callback: Optional[Callable[[str], None]] = None):
+                 log_callback: Optional[Callable[[str], None]] = None,
+                 buffer_pool: Optional[BufferPool] = None):
         """
         初始化批量下载管理器
         
@@ -996,13 +1283,17 @@ class BatchDownloader:
             max_concurrent_tasks: 最大并发任务数
             max_concurrent_downloads_per_task: 每个任务的最大并发下载数
             log_callback: 日志回调函数，用于记录日志信息
+            buffer_pool: 所有调度器共用的缓冲区池，不指定时使用进程级共享的缓冲区池
         """
         self.max_concurrent_tasks = max_concurrent_tasks
+        self.buffer_pool = buffer_pool or _buffer_pool
         self.max_concurrent_downloads_per_task = max_concurrent_downloads_per_task
         self.schedulers: Dict[str, SmartDownloadScheduler] = {}
         self.task_results: Dict[str, Dict[str, DownloadResult]] = {}
         self._lock = threading.Lock()
         self.log_callback = log_callback  # 日志回调函数
+        # 与所有调度器共享keep-alive连接池，按全部任务同时下载时的总连接数申请
+        self._session = _get_shared_session(max_concurrent_tasks * max_concurrent_downloads_per_task)
         
         # 全局性能监控
         self._total_downloads = 0
@@ -1029,70 +1320,105 @@ class BatchDownloader:
         sorted_segments = self._optimize_task_order(ts_segments)
         
         with self._lock:
-            if task_id not in self.schedulers:
-                self.schedulers[task_id] = SmartDownloadScheduler(
-                    max_concurrent_downloads=self.max_concurrent_downloads_per_task,
-                    log_callback=self.log_callback
-                )
-                self.task_results[task_id] = {}
-            
-            scheduler = self.schedulers[task_id]
-            added_count = 0
+            return self._add_m3u8_task_locked(task_id, sorted_segments, priority, retry_count,
+                                              memory_efficient, urgent_segments)
+    
+    def add_m3u8_tasks(self, tasks: List[Tuple[str, List[Tuple[str, str]], DownloadPriority, int]],
+                       memory_efficient: bool = True) -> List[int]:
+        """
+        批量添加M3U8任务，所有任务在一次加锁内完成入队
+        
+        Args:
+            tasks: (task_id, ts_segments, priority, retry_count) 列表
             
-            # 为每个片段创建下载任务
-            for i, (url, filepath) in enumerate(sorted_segments):
-                # 动态调整优先级 - 大文件和关键片段优先级更高
-                segment_priority = self._calculate_segment_priority(url, filepath, priority, i, len(sorted_segments))
-                
-                # 检查是否为紧急片段
-                is_urgent = urgent_segments and i in urgent_segments
-                if is_urgent:
-                    segment_priority = DownloadPriority.URGENT
-                
-                download_task = DownloadTask(
-                    task_id=f"{task_id}_segment_{i}",
-                    url=url,
-                    filepath=filepath,
-                    priority=segment_priority,
-                    retry_count=retry_count,
-                    memory_efficient=memory_efficient
-                )
-                
-                # 紧急任务使用特殊添加方法
-                if is_urgent:
-                    scheduler.add_urgent_task(download_task)
-                else:
-                    scheduler.add_task(download_task)
-                added_count += 1
-                
-                # 每50个任务记录一次进度
-                if self.log_callback and (added_count % 50 == 0):
-                    self.log_callback(f"  📥 已添加 {added_count}/{len(sorted_segments)} 个任务到队列...")
+        Returns:
+            每个任务添加的片段数
+        """
+        # 片段排序可能需要网络请求，放在锁外完成
+        prepared = [(task_id, self._optimize_task_order(ts_segments), priority, retry_count)
+                    for task_id, ts_segments, priority, retry_count in tasks]
+        with self._lock:
+            return [self._add_m3u8_task_locked(task_id, sorted_segments, priority, retry_count, memory_efficient)
+                    for task_id, sorted_segments, priority, retry_count in prepared]
+    
+    def _add_m3u8_task_locked(self, task_id: str, sorted_segments: List[Tuple[str, str]],
+                              priority: DownloadPriority, retry_count: int, memory_efficient: bool,
+                              urgent_segments: Optional[List[int]] = None) -> int:
+        """为已排序的片段创建下载任务并启动调度器（调用方需持有 self._lock）"""
+        if task_id not in self.schedulers:
+            self.schedulers[task_id] = SmartDownloadScheduler(
+                max_concurrent_downloads=self.max_concurrent_downloads_per_task,
+                log_callback=self.log_callback,
+                buffer_pool=self.buffer_pool
+            )
+            self.task_results[task_id] = {}
+        
+        scheduler = self.schedulers[task_id]
+        added_count = 0
+        
+        # 一次算出所有片段的优先级 - 关键片段优先级更高，已存在的片段降低
+        segment_priorities = self._calculate_segment_priorities(sorted_segments, priority)
+        urgent_indexes = set(urgent_segments) if urgent_segments else ()
+        
+        # 为每个片段创建下载任务
+        for i, (url, filepath) in enumerate(sorted_segments):
+            segment_priority = segment_priorities[i]
             
-            # 启动调度器
-            scheduler.start()
+            # 检查是否为紧急片段
+            is_urgent = i in urgent_indexes
+            if is_urgent:
+                segment_priority = DownloadPriority.URGENT
             
-            # 记录启动信息
-            if self.log_callback:
-                self.log_callback(f"🚀 调度器已启动，开始下载 {added_count} 个片段")
-                self.log_callback(f"  ⚙️ 最大并发数: {self.max_concurrent_downloads_per_task}")
+            download_task = DownloadTask(
+                task_id=f"{task_id}_segment_{i}",
+                url=url,
+                filepath=filepath,
+                priority=segment_priority,
+                retry_count=retry_count,
+                memory_efficient=memory_efficient
+            )
             
-            # 启动智能监控线程
-            threading.Thread(target=self._smart_monitor, args=(task_id,), daemon=True).start()
+            # 紧急任务使用特殊添加方法
+            if is_urgent:
+                scheduler.add_urgent_task(download_task)
+            else:
+                scheduler.add_task(download_task)
+            added_count += 1
             
-            return added_count
+            # 每50个任务记录一次进度
+            if self.log_callback and (added_count % 50 == 0):
+                self.log_callback(f"  📥 已添加 {added_count}/{len(sorted_segments)} 个任务到队列...")
+        
+        # 启动调度器
+        scheduler.start()
+        
+        # 记录启动信息
+        if self.log_callback:
+            self.log_callback(f"🚀 调度器已启动，开始下载 {added_count} 个片段")
+            self.log_callback(f"  ⚙️ 最大并发数: {self.max_concurrent_downloads_per_task}")
+        
+        # 启动智能监控线程
+        threading.Thread(target=self._smart_monitor, args=(task_id,), daemon=True).start()
+        
+        return added_count
     
     def _optimize_task_order(self, ts_segments: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
         """
         优化任务顺序 - 随机打乱以提高并发效率
 
-        不再检查文件大小，直接随机分配任务以避免网络请求导致的延迟
+        不再检查文件大小，直接随机分配任务以避免网络请求导致的延迟。
+        片段数不超过并发数（会被同时下载）或全部来自同一主机时，打乱没有收益，
+        保持原始顺序，让靠前的片段先下载完成
         """
-        import random
-
-        # 直接随机打乱任务顺序，提高并发下载效率
-        randomized_segments = ts_segments.copy()
-        random.shuffle(randomized_segments)
+        if len(ts_segments) <= self.max_concurrent_downloads_per_task:
+            return ts_segments
+        
+        first_host = ts_segments[0][0].partition('://')[2].partition('/')[0]
+        if all(url.partition('://')[2].partition('/')[0] == first_host for url, _ in ts_segments):
+            return ts_segments
+        
+        # 直接随机打乱任务顺序，提高并发下载效率（random.sample 返回新列表，不修改传入的片段列表）
+        randomized_segments = random.sample(ts_segments, len(ts_segments))
 
         if self.log_callback:
             self.log_callback(f"  🔀 已随机化 {len(ts_segments)} 个下载任务的顺序")
@@ -1104,18 +1430,18 @@ class BatchDownloader:
         try:
             # 使用GET请求并只读取头部，因为某些服务器不支持HEAD请求
             headers = self._get_headers(url) if hasattr(self, '_get_headers') else {}
-            response = requests.head(url, headers=headers, timeout=10, allow_redirects=True)
-            if response.status_code == 200 or response.status_code == 206:
-                content_length = response.headers.get('content-length')
-                return int(content_length) if content_length else None
-            return None
+            with self._session.head(url, headers=headers, timeout=10, allow_redirects=True) as response:
+                if response.status_code == 200 or response.status_code == 206:
+                    content_length = response.headers.get('content-length')
+                    return int(content_length) if content_length else None
+                return None
         except Exception:
             # 如果HEAD请求失败，尝试GET但只读取头信息
             try:
                 headers = self._get_headers(url) if hasattr(self, '_get_headers') else {}
                 headers['Range'] = 'bytes=0-0'  # 只请求1字节
-                response = requests.get(url, headers=headers, timeout=10, stream=True)
-                content_length = response.headers.get('content-range') or response.headers.get('content-length')
+                with self._session.get(url, headers=headers, timeout=10, stream=True) as response:
+                    content_length = response.headers.get('content-range') or response.headers.get('content-length')
                 if content_length:
                     # 解析 Content-Range: bytes 0-0/1234567
                     if '/' in content_length:
@@ -1146,32 +1472,52 @@ class BatchDownloader:
         
         return weight
     
-    def _calculate_segment_priority(self, url: str, filepath: str, base_priority: DownloadPriority, 
-                                 index: int, total: int) -> DownloadPriority:
-        """动态计算片段优先级"""
-        # 基础优先级
-        priority_value = base_priority.value
+    def _scan_existing_files(self, segments: List[Tuple[str, str]]) -> set:
+        """
+        按目录批量列出已存在的文件
+        
+        Returns:
+            已存在文件的 (目录, 文件名) 集合，与 os.path.split(filepath) 的结果对应
+        """
+        existing = set()
+        for directory in {os.path.dirname(filepath) for _, filepath in segments}:
+            try:
+                with os.scandir(directory or '.') as entries:
+                    for entry in entries:
+                        existing.add((directory, entry.name))
+            except OSError:
+                pass  # 目录不存在时没有已下载的文件
+        return existing
+    
+    def _calculate_segment_priorities(self, segments: List[Tuple[str, str]],
+                                      base_priority: DownloadPriority) -> List[DownloadPriority]:
+        """
+        批量计算片段优先级
+        
+        前3个片段为紧急，前10%至少为高优先级；已存在的文件（断点续传）降低一级。
+        按区间整段赋值，不再逐个片段调用判断
+        """
+        total = len(segments)
+        base_value = base_priority.value
+        values = [base_value] * total
         
         # 关键片段提升优先级
-        if index < 3:  # 前几个片段
-            priority_value = max(priority_value, DownloadPriority.URGENT.value)
-        elif index < total * 0.1:  # 前10%
-            priority_value = max(priority_value, DownloadPriority.HIGH.value)
+        urgent_end = min(3, total)
+        values[:urgent_end] = [max(base_value, DownloadPriority.URGENT.value)] * urgent_end
+        high_end = max(urgent_end, -(-total // 10))  # 前10%（向上取整）
+        values[urgent_end:high_end] = [max(base_value, DownloadPriority.HIGH.value)] * (high_end - urgent_end)
         
-        # 检查是否已存在（断点续传）
-        if os.path.exists(filepath):
-            # 已存在文件，优先级降低
-            priority_value = max(priority_value - 1, DownloadPriority.LOW.value)
+        # 已存在文件，优先级降低（一次列出各目录，避免逐个片段 stat）
+        existing_files = self._scan_existing_files(segments)
+        if existing_files:
+            low_value = DownloadPriority.LOW.value
+            for i, (_, filepath) in enumerate(segments):
+                if os.path.split(filepath) in existing_files:
+                    values[i] = max(values[i] - 1, low_value)
         
-        # 转换为枚举
-        if priority_value >= DownloadPriority.URGENT.value:
-            return DownloadPriority.URGENT
-        elif priority_value >= DownloadPriority.HIGH.value:
-            return DownloadPriority.HIGH
-        elif priority_value >= DownloadPriority.NORMAL.value:
-            return DownloadPriority.NORMAL
-        else:
-            return DownloadPriority.LOW
+        # DownloadPriority 的值从0开始连续，可直接按值索引
+        priorities = tuple(DownloadPriority)
+        return [priorities[value] for value in values]
     
     def _smart_monitor(self, task_id: str):
         """
@@ -1188,7 +1534,12 @@ class BatchDownloader:
         
         while task_id in self.schedulers:
             try:
-                time.sleep(10)  # 每10秒检查一次
+                scheduler = self.schedulers.get(task_id)
+                if scheduler is None:
+                    break
+                # 每10秒检查一次；全部片段结束或任务停止时立即返回并结束监控
+                if scheduler.wait_until_idle(timeout=10):
+                    break
                 
                 current_time = time.time()
                 
@@ -1266,108 +1617,47 @@ class BatchDownloader:
         except Exception as e:
             print(f"调整下载策略出错: {e}")
 
-    def add_m3u8_task(self, task_id: str, ts_segments: List[Tuple[str, str]], 
-                     priority: DownloadPriority = DownloadPriority.NORMAL,
-                     retry_count: int = 3) -> int:
-        """
-        智能任务分配算法 - 根据片段大小和网络状况动态分配下载任务
-        
-        算法特点：
-        1. 基于片段大小进行任务分组，大文件优先下载
-        2. 根据网络延迟动态调整并发数
-        3. 支持断点续传和失败重试
-        4. 实时监控下载速度和成功率
-        """
-        # 智能任务分配逻辑
-        sorted_segments = self._optimize_task_order(ts_segments)
-        
-        with self._lock:
-            if task_id not in self.schedulers:
-                self.schedulers[task_id] = SmartDownloadScheduler(
-                    max_concurrent_downloads=self.max_concurrent_downloads_per_task,
-                    log_callback=self.log_callback
-                )
-                self.task_results[task_id] = {}
-            
-            scheduler = self.schedulers[task_id]
-            added_count = 0
-            
-            # 为每个片段创建下载任务
-            for i, (url, filepath) in enumerate(sorted_segments):
-                # 动态调整优先级 - 大文件和关键片段优先级更高
-                segment_priority = self._calculate_segment_priority(url, filepath, priority, i, len(sorted_segments))
-                
-                download_task = DownloadTask(
-                    task_id=f"{task_id}_segment_{i}",
-                    url=url,
-                    filepath=filepath,
-                    priority=segment_priority,
-                    retry_count=retry_count
-                )
-                scheduler.add_task(download_task)
-                added_count += 1
-            
-            # 启动调度器
-            scheduler.start()
-            
-            # 记录启动信息
-            if self.log_callback:
-                self.log_callback(f"🚀 调度器已启动，开始下载 {added_count} 个片段")
-                self.log_callback(f"  ⚙️ 最大并发数: {self.max_concurrent_downloads_per_task}")
-            
-            # 启动智能监控线程
-            threading.Thread(target=self._smart_monitor, args=(task_id,), daemon=True).start()
-            
-            return added_count
-    
     def get_task_progress(self, task_id: str) -> Optional[Dict[str, int]]:
-        """获取任务进度和队列状态"""
+        """获取任务进度和队列状态 - 直接读取调度器维护的完成计数，不遍历片段结果"""
         with self._lock:
-            if task_id not in self.schedulers:
-                return None
-
-            scheduler = self.schedulers[task_id]
-            results = self.task_results[task_id]
-
-            # 获取所有已完成的结果 - 从scheduler获取
-            for segment_id in list(results.keys()):
-                if segment_id not in results:
-                    result = scheduler.get_result(segment_id)
-                    if result:
-                        results[segment_id] = result
-
-            # 计算总体进度
-            total_segments = len(results)
-            completed_segments = sum(1 for r in results.values() if r.success)
-            total_bytes = sum(r.total_bytes for r in results.values())
-            downloaded_bytes = sum(r.downloaded_bytes for r in results.values())
+            scheduler = self.schedulers.get(task_id)
+        if scheduler is None:
+            return None
 
-            # 如果还没有任何结果，尝试从scheduler的活跃下载中获取信息
-            if total_segments == 0:
-                # 获取调度器的队列状态
-                queue_status = scheduler.get_queue_status()
-                total_segments = queue_status.get('queued_tasks', 0) + queue_status.get('active_downloads', 0)
-                completed_segments = 0
-                total_bytes = 0
-                downloaded_bytes = 0
+        finished_segments, completed_segments, downloaded_bytes, total_bytes = scheduler.get_completion_counters()
+        active_downloads = scheduler.get_active_count()
+        queue_size = scheduler.get_queue_size()
+        total_segments = finished_segments + active_downloads + queue_size
 
-            return {
-                'total_segments': total_segments,
-                'completed_segments': completed_segments,
-                'total_bytes': total_bytes,
-                'downloaded_bytes': downloaded_bytes,
-                'progress_percentage': (completed_segments / total_segments * 100) if total_segments > 0 else 0,
-                'active_downloads': scheduler.get_active_count(),
-                'queue_size': scheduler.get_queue_size()
-            }
+        return {
+            'total_segments': total_segments,
+            'completed_segments': completed_segments,
+            'total_bytes': total_bytes,
+            'downloaded_bytes': downloaded_bytes,
+            'progress_percentage': (completed_segments / total_segments * 100) if total_segments > 0 else 0,
+            'active_downloads': active_downloads,
+            'queue_size': queue_size
+        }
 
     def get_all_tasks_status(self) -> Dict[str, Dict[str, int]]:
         """获取所有任务的状态"""
-        all_status = {}
         with self._lock:
-            for task_id in self.schedulers:
-                all_status[task_id] = self.get_task_progress(task_id) or {}
-        return all_status
+            task_ids = list(self.schedulers)
+        # get_task_progress 自己会加锁，这里不能在持有锁时调用（Lock不可重入）
+        return {task_id: self.get_task_progress(task_id) or {} for task_id in task_ids}
+    
+    def wait_task(self, task_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        等待指定任务的所有片段结束
+        
+        Returns:
+            任务是否已结束（不存在的任务视为已结束），超时返回False
+        """
+        with self._lock:
+            scheduler = self.schedulers.get(task_id)
+        if scheduler is None:
+            return True
+        return scheduler.wait_until_idle(timeout)
     
     def stop_task(self, task_id: str):
         """停止指定任务"""
@@ -1460,14 +1750,16 @@ _batch_downloader = None
 
 def get_batch_downloader(max_concurrent_tasks: int = 3, 
                         max_concurrent_downloads_per_task: int = 10,
-                        log_callback: Optional[Callable[[str], None]] = None) -> BatchDownloader:
-    """获取全局批量下载器实例"""
+                        log_callback: Optional[Callable[[str], None]] = None,
+                        buffer_pool: Optional[BufferPool] = None) -> BatchDownloader:
+    """获取全局批量下载器实例（buffer_pool 仅在首次创建时生效）"""
     global _batch_downloader
     if _batch_downloader is None:
         _batch_downloader = BatchDownloader(
             max_concurrent_tasks=max_concurrent_tasks,
             max_concurrent_downloads_per_task=max_concurrent_downloads_per_task,
-            log_callback=log_callback
+            log_callback=log_callback,
+            buffer_pool=buffer_pool
         )
     else:
         # 如果已存在，更新日志回调
@@ -1481,7 +1773,8 @@ def get_batch_downloader(max_concurrent_tasks: int = 3,
 
 def print_batch_downloader_stats():
     """打印批量下载器统计信息"""
-    batch_downloader = get_batch_downloader()
+    # 直接读取全局实例：get_batch_downloader() 在未初始化时会创建一个新的下载器
+    batch_downloader = _batch_downloader
     if batch_downloader:
         batch_downloader.print_performance_report()
     else:
@@ -1489,8 +1782,8 @@ def print_batch_downloader_stats():
 
 
 def get_batch_downloader_performance_stats() -> Dict[str, float]:
-    """获取批量下载器性能统计"""
-    batch_downloader = get_batch_downloader()
+    """获取批量下载器性能统计（供界面定时轮询，未初始化时返回空字典）"""
+    batch_downloader = _batch_downloader
     if batch_downloader:
         return batch_downloader.get_global_performance_stats()
     return {}
\ No newline at end of file
@@ -31,19 +31,17 @@ def demo_basic_performance_monitoring():
     ]
     
     # 添加任务到下载器
-    for i in range(2):
-        task_id = f"task_{i+1}"
-        
-        batch_downloader.add_m3u8_task(
-            task_id=task_id,
-            ts_segments=test_urls,
-            priority=DownloadPriority.NORMAL,
-            retry_count=1
-        )
+    task_ids = [f"task_{i+1}" for i in range(2)]
+    batch_downloader.add_m3u8_tasks([
+        (task_id, test_urls, DownloadPriority.NORMAL, 1) for task_id in task_ids
+    ])
     
-    # 等待任务完成（模拟）
+    # 等待任务完成，全部片段结束即返回，最多等待60秒
     print("模拟下载任务执行中...")
-    time.sleep(5)
+    deadline = time.monotonic() + 60
+    for task_id in task_ids:
+        if not batch_downloader.wait_task(task_id, timeout=max(0.0, deadline - time.monotonic())):
+            print(f"任务 {task_id} 未在限定时间内完成")
     
     # 打印性能统计报告
     print("\n=== 下载器性能报告 ===")
@@ -52,11 +50,10 @@ def demo_basic_performance_monitoring():
     # 获取详细的性能统计
     stats = get_batch_downloader_performance_stats()
     print(f"\n=== 详细统计信息 ===")
-    for key, value in stats.items():
-        if isinstance(value, float):
-            print(f"{key}: {value:.2f}")
-        else:
-            print(f"{key}: {value}")
+    # 按值类型为每个键预先选好格式化函数，整份统计拼接后一次输出
+    formatters = {key: ("{}: {:.2f}" if isinstance(value, float) else "{}: {}").format
+                  for key, value in stats.items()}
+    print("\n".join(formatters[key](key, value) for key, value in stats.items()))
 
 
 def demo_advanced_performance_monitoring():
@@ -80,7 +77,6 @@ def demo_advanced_performance_monitoring():
             download_time=2.5,
             success=True
         )
-        time.sleep(0.5)
     
     # 获取实时监控数据
     print("\n=== 实时性能数据 ===")
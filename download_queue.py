@@ -7,7 +7,9 @@
 
 import threading
 import time
-from typing import Dict, List, Callable, Optional
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Deque, Dict, Set, Callable, Optional
 from task_manager import TaskManager, TaskStatus, DownloadTask
 
 class DownloadQueue:
@@ -24,132 +26,337 @@ class DownloadQueue:
         self.task_manager = task_manager
         self.max_concurrent = max_concurrent
         self.lock = threading.Lock()
-        self.running_tasks: Dict[str, threading.Thread] = {}  # 正在运行的任务 {task_id: thread}
-        self.pending_tasks: List[str] = []  # 等待中的任务ID列表
+        # 常驻工作线程池，复用线程而不是每个任务新建线程；实际并发数由 running_tasks 数量控制。
+        # 队列中的每个任务是一整个M3U8的下载流程，同时只运行少数几个，线程切换开销可以忽略，
+        # 回调保持同步接口；片段级并发由回调内部的下载器负责
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="dlq")
+        self.running_tasks: Dict[str, Future] = {}  # 正在运行的任务 {task_id: future}
+        self.pending_tasks: Deque[str] = deque()  # 等待中的任务ID（先进先出）
+        self._pending_set: Set[str] = set()  # 真正在等待的任务，用于O(1)判断任务是否在等待
+        # 被移除的任务不立即从 pending_tasks 中删除（deque.remove 是O(N)），而是记一个墓碑，
+        # 调度时弹出再跳过；同一ID可能被反复移除/加入，因此按次数计
+        self._canceled: Dict[str, int] = {}
+        self._canceled_count = 0
         self.download_callback: Optional[Callable] = None  # 下载回调函数
+        self.status_callback: Optional[Callable] = None  # 队列状态变化回调（可能在持锁时调用，须保持轻量）
         self.is_running = True
         
+        # 队列状态变化时通知调度线程，由它统一启动任务，调用方只需入队
+        self._cv = threading.Condition(self.lock)
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True, name="dlq-dispatch")
+        self._dispatcher.start()
+        
     def set_download_callback(self, callback: Callable):
         """设置下载回调函数"""
-        self.download_callback = callback
+        with self._cv:
+            self.download_callback = callback
+            # 设置回调前已入队的任务由调度线程开始处理
+            self._cv.notify()
+        
+    def set_status_callback(self, callback: Optional[Callable]):
+        """设置队列状态变化回调（运行中/等待中的任务或并发数变化时调用，不带参数）"""
+        self.status_callback = callback
+    
+    def _notify_status_change(self):
+        callback = self.status_callback
+        if callback is not None:
+            try:
+                callback()
+            except Exception:
+                pass  # 忽略回调中的错误
         
     def add_to_queue(self, task_id: str):
         """将任务添加到队列"""
+        self.add_tasks_to_queue((task_id,))
+    
+    def add_tasks_to_queue(self, task_ids):
+        """批量将任务添加到队列，只加一次锁、只唤醒一次调度线程"""
+        if self.download_callback is None:
+            # 没有下载回调时任务永远不会被执行，直接标记失败而不是留在队列里
+            for task_id in task_ids:
+                self.task_manager.set_task_error(task_id, "未设置下载回调函数")
+            return
+        
         with self.lock:
-            if task_id not in self.pending_tasks and task_id not in self.running_tasks:
-                self.pending_tasks.append(task_id)
+            new_ids = []
+            for task_id in task_ids:
+                if task_id in self._pending_set or task_id in self.running_tasks:
+                    continue
+                self._pending_set.add(task_id)
+                new_ids.append(task_id)
+            if not new_ids:
+                return
+            
+            # 新建的任务本来就是等待状态，只有状态真正改变时（如重新开始已停止的任务）才写一次；
+            # 必须在入队前完成，否则调度线程会把仍是"已停止"的任务跳过
+            changed = []
+            for task_id in new_ids:
                 task = self.task_manager.get_task(task_id)
-                if task:
-                    task.status = TaskStatus.PENDING
-                    self.task_manager.update_task_status(task_id, TaskStatus.PENDING)
-        
-        # 尝试启动任务
-        self._try_start_next_task()
+                if task and task.status != TaskStatus.PENDING:
+                    changed.append(task_id)
+            if changed:
+                self.task_manager.update_tasks_status(changed, TaskStatus.PENDING)
+            self.pending_tasks.extend(new_ids)
+            self._cv.notify()
+        self._notify_status_change()
         
     def remove_from_queue(self, task_id: str):
         """从队列中移除任务"""
         with self.lock:
-            # 从等待队列中移除
-            if task_id in self.pending_tasks:
-                self.pending_tasks.remove(task_id)
+            # 从等待队列中移除（惰性删除：只记墓碑，调度时跳过）
+            removed = task_id in self._pending_set
+            if removed:
+                self._pending_set.discard(task_id)
+                self._canceled[task_id] = self._canceled.get(task_id, 0) + 1
+                self._canceled_count += 1
+                if self._canceled_count > 1024:
+                    self._compact_pending()
             
             # 如果任务正在运行，停止它
             if task_id in self.running_tasks:
                 self.task_manager.update_task_status(task_id, TaskStatus.STOPPED)
                 # 注意：线程会自然结束，我们只是标记状态
+        if removed:
+            self._notify_status_change()
         
-    def _try_start_next_task(self):
-        """尝试启动下一个任务"""
-        with self.lock:
-            # 检查是否还有空位
-            if len(self.running_tasks) >= self.max_concurrent:
-                return
-            
-            # 检查是否有等待中的任务
-            if not self.pending_tasks:
-                return
-            
+    def _compact_pending(self):
+        """墓碑过多时重建等待队列，丢弃已移除的条目（调用方需持有锁）"""
+        compacted = deque()
+        for task_id in self.pending_tasks:
+            count = self._canceled.get(task_id)
+            if count:
+                if count == 1:
+                    del self._canceled[task_id]
+                else:
+                    self._canceled[task_id] = count - 1
+                continue
+            compacted.append(task_id)
+        self.pending_tasks = compacted
+        self._canceled.clear()
+        self._canceled_count = 0
+    
+    def _can_dispatch(self) -> bool:
+        """是否需要调度线程处理：有空位且有等待中的任务"""
+        return (self.download_callback is not None and len(self.running_tasks) < self.max_concurrent
+                and bool(self._pending_set))
+    
+    def _dispatch_loop(self):
+        """调度线程 - 等待队列状态变化，一次加锁启动尽可能多的任务直到并发数已满"""
+        with self._cv:
+            while True:
+                self._cv.wait_for(self._can_dispatch)
+                self._start_pending_tasks()
+    
+    def _start_pending_tasks(self):
+        """启动等待中的任务（调用方需持有锁）"""
+        to_start = []
+        # 还有空位且有等待中的任务
+        while len(self.running_tasks) + len(to_start) < self.max_concurrent and self.pending_tasks:
             # 获取第一个等待中的任务
-            task_id = self.pending_tasks.pop(0)
+            task_id = self.pending_tasks.popleft()
+            count = self._canceled.get(task_id)
+            if count:
+                # 已被移除的条目
+                if count == 1:
+                    del self._canceled[task_id]
+                else:
+                    self._canceled[task_id] = count - 1
+                self._canceled_count -= 1
+                continue
+            self._pending_set.discard(task_id)
             task = self.task_manager.get_task(task_id)
             
             if not task or task.status == TaskStatus.STOPPED:
                 # 任务不存在或已被停止，尝试下一个
-                self._try_start_next_task()
-                return
-            
-            # 创建下载线程
-            if self.download_callback:
-                download_thread = threading.Thread(
-                    target=self._run_task_with_callback,
-                    args=(task_id, task)
-                )
-                download_thread.daemon = True
-                download_thread.start()
-                self.running_tasks[task_id] = download_thread
-                
-                # 更新任务状态
-                self.task_manager.update_task_status(task_id, TaskStatus.DOWNLOADING)
-        
-        # 继续尝试启动更多任务
-        self._try_start_next_task()
+                continue
+            to_start.append((task_id, task))
+        
+        if not to_start:
+            return
+        
+        # 本批任务的状态一次性更新（只保存/通知一次），并且在提交前完成，
+        # 避免覆盖回调中很快写入的完成状态
+        self.task_manager.update_tasks_status([task_id for task_id, _ in to_start], TaskStatus.DOWNLOADING)
+        
+        # 提交到工作线程池（_can_dispatch 已保证回调存在）
+        for task_id, task in to_start:
+            self.running_tasks[task_id] = self._executor.submit(self._run_task_with_callback, task_id, task)
+        self._notify_status_change()
         
     def _run_task_with_callback(self, task_id: str, task: DownloadTask):
         """运行任务并处理完成回调"""
         try:
             # 调用下载回调函数
-            if self.download_callback:
-                self.download_callback(
-                    task_id,
-                    task.url,
-                    task.folder,
-                    task.thread_count,
-                    task.retry_count,
-                    task.auto_merge
-                )
+            self.download_callback(
+                task_id,
+                task.url,
+                task.folder,
+                task.thread_count,
+                task.retry_count,
+                task.auto_merge
+            )
         except Exception as e:
             # 下载过程中出错
             self.task_manager.set_task_error(task_id, str(e))
         finally:
-            # 任务完成或停止后，从运行列表中移除
-            with self.lock:
+            # 任务完成或停止后，从运行列表中移除，并通知调度线程启动下一个任务
+            with self._cv:
                 if task_id in self.running_tasks:
                     del self.running_tasks[task_id]
-            
-            # 启动下一个任务
-            self._try_start_next_task()
+                self._cv.notify()
+            self._notify_status_change()
             
     def get_queue_status(self) -> dict:
         """获取队列状态"""
+        # 锁内只做最快的 tuple 快照，其余构造放到锁外，缩短界面轮询时的持锁时间
         with self.lock:
-            return {
-                "running_count": len(self.running_tasks),
-                "pending_count": len(self.pending_tasks),
-                "max_concurrent": self.max_concurrent,
-                "running_tasks": list(self.running_tasks.keys()),
-                "pending_tasks": self.pending_tasks.copy()
-            }
+            running_ids = tuple(self.running_tasks)
+            pending_ids = tuple(self.pending_tasks)
+            canceled = dict(self._canceled) if self._canceled else None
+            max_concurrent = self.max_concurrent
+        if canceled:
+            # 去掉尚未被调度线程弹出的墓碑条目
+            live_ids = []
+            for task_id in pending_ids:
+                count = canceled.get(task_id)
+                if count:
+                    canceled[task_id] = count - 1
+                else:
+                    live_ids.append(task_id)
+            pending_ids = tuple(live_ids)
+        return {
+            "running_count": len(running_ids),
+            "pending_count": len(pending_ids),
+            "max_concurrent": max_concurrent,
+            "running_tasks": list(running_ids),
+            "pending_tasks": list(pending_ids)
+        }
             
     def set_max_concurrent(self, max_concurrent: int):
         """设置最大并发数"""
         with self.lock:
+            if max_concurrent > self.max_concurrent:
+                # 线程池容量不能动态扩大，换一个更大的线程池；旧线程池中正在运行的任务会继续完成
+                old_executor = self._executor
+                self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="dlq")
+                old_executor.shutdown(wait=False)
             self.max_concurrent = max_concurrent
-        
-        # 尝试启动更多任务
-        self._try_start_next_task()
+            
+            # 通知调度线程启动更多任务
+            self._cv.notify()
+        self._notify_status_change()
         
     def stop_all(self):
-        """停止所有任务"""
+        """停止所有任务（只停止和清空当前任务，调度线程继续运行，之后加入的任务照常启动）"""
         with self.lock:
             # 停止所有运行中的任务
-            for task_id in list(self.running_tasks.keys()):
-                self.task_manager.update_task_status(task_id, TaskStatus.STOPPED)
+            self.task_manager.update_tasks_status(tuple(self.running_tasks), TaskStatus.STOPPED)
             
             # 清空等待队列
             self.pending_tasks.clear()
-            self.is_running = False
+            self._pending_set.clear()
+            self._canceled.clear()
+            self._canceled_count = 0
+        self._notify_status_change()
             
     def clear_pending(self):
         """清空等待队列"""
         with self.lock:
-            self.pending_tasks.clear()
\ No newline at end of file
+            self.pending_tasks.clear()
+            self._pending_set.clear()
+            self._canceled.clear()
+            self._canceled_count = 0
+        self._notify_status_change()
+
+class AdaptiveConcurrencyController:
+    """
+    自适应并发控制器 - 根据实测总下载速度调整下载队列的最大并发任务数
+    
+    每个采样周期统计所有任务已下载字节数的增量得到总吞吐量：
+    吞吐量比上次明显上升，就沿当前方向继续调整；明显下降，就反向调整；
+    变化不大则保持不变。队列中没有运行中的任务时不调整。
+    
+    只调整同时运行的任务数；每个任务的片段并发数由批量下载器固定，
+    因此 max_limit 应按 连接总预算 ÷ 每任务片段并发数 设置。
+    """
+    
+    def __init__(self, download_queue: DownloadQueue, task_manager: TaskManager,
+                 initial_limit: int = 4, min_limit: int = 2, max_limit: int = 32,
+                 interval: float = 3.0, tolerance: float = 0.05):
+        """
+        初始化自适应并发控制器
+        
+        Args:
+            download_queue: 被控制的下载队列
+            task_manager: 任务管理器实例，用于统计已下载字节数
+            initial_limit: 初始并发数（保守起步，吞吐量提升时再逐步增加）
+            min_limit: 最小并发数
+            max_limit: 最大并发数（连接预算允许的任务数）
+            interval: 采样周期（秒）
+            tolerance: 吞吐量变化小于该比例时视为不变
+        """
+        self.download_queue = download_queue
+        self.task_manager = task_manager
+        self.min_limit = min(min_limit, max_limit)
+        self.max_limit = max_limit
+        self.interval = interval
+        self.tolerance = tolerance
+        self.current_limit = max(self.min_limit, min(initial_limit, max_limit))
+        self._direction = 1  # 下一次调整的方向
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        
+    def start(self):
+        """启动控制线程"""
+        if self._thread is not None:
+            return
+        self.download_queue.set_max_concurrent(self.current_limit)
+        self._thread = threading.Thread(target=self._control_loop, daemon=True, name="dlq-concurrency")
+        self._thread.start()
+        
+    def stop(self):
+        """停止控制线程"""
+        self._stop_event.set()
+        
+    def _total_downloaded_bytes(self) -> int:
+        return sum(task.downloaded_bytes for task in self.task_manager.get_all_tasks())
+        
+    def _control_loop(self):
+        """控制循环 - 按周期采样吞吐量并调整并发数"""
+        last_bytes = self._total_downloaded_bytes()
+        last_time = time.monotonic()
+        last_throughput = 0.0
+        
+        while not self._stop_event.wait(self.interval):
+            current_bytes = self._total_downloaded_bytes()
+            current_time = time.monotonic()
+            delta_bytes = current_bytes - last_bytes
+            elapsed = current_time - last_time
+            last_bytes, last_time = current_bytes, current_time
+            
+            # 没有运行中的任务，或有任务被删除导致统计回退时，本周期不做判断
+            if delta_bytes < 0 or elapsed <= 0 or not self.download_queue.running_tasks:
+                last_throughput = 0.0
+                continue
+            
+            throughput = delta_bytes / elapsed
+            if last_throughput > 0:
+                if throughput < last_throughput * (1 - self.tolerance):
+                    # 上一次调整使吞吐量下降，反向调整
+                    self._direction = -self._direction
+                    self._apply(self.current_limit + self._direction)
+                elif throughput > last_throughput * (1 + self.tolerance):
+                    self._apply(self.current_limit + self._direction)
+            else:
+                # 首个有效样本：先按当前方向试探一步
+                self._apply(self.current_limit + self._direction)
+            last_throughput = throughput
+            
+    def _apply(self, new_limit: int):
+        new_limit = max(self.min_limit, min(new_limit, self.max_limit))
+        if new_limit == self.current_limit:
+            # 到达边界后下一次朝反方向试探
+            self._direction = -self._direction
+            return
+        self.current_limit = new_limit
+        self.download_queue.set_max_concurrent(new_limit)
@@ -12,10 +12,18 @@ import os
 import sys
 import subprocess
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import urljoin, urlparse
 import re
 import time
+import codecs
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Optional
 
 try:
     import ttkbootstrap as ttkb
@@ -33,62 +41,235 @@ except ImportError:
     HAS_PIL = False
 
 # 导入任务管理器
-from task_manager import task_manager, TaskStatus, DownloadTask
-from download_queue import DownloadQueue
+from task_manager import task_manager, TaskStatus, DownloadTask, FINISHED_STATUSES
+from download_queue import DownloadQueue, AdaptiveConcurrencyController
 from optimized_downloader import DownloadPool
 from advanced_downloader import (
-    BatchDownloader, DownloadPriority, get_batch_downloader,
+    BatchDownloader, BufferPool, DownloadPriority, get_batch_downloader,
     SmartDownloadScheduler, DownloadTask as AdvancedDownloadTask,
     print_batch_downloader_stats, get_batch_downloader_performance_stats
 )
 
+_HTTP_PREFIXES = ('http://', 'https://')
+
+# 片段连接预算：每个任务的片段并发数固定，自适应控制器调整同时下载的任务数时，
+# 任务数 × 每任务片段并发数 不超过连接总预算
+_DOWNLOADS_PER_TASK = 15
+_CONNECTION_BUDGET = 96
+_MAX_CONCURRENT_TASKS = max(2, _CONNECTION_BUDGET // _DOWNLOADS_PER_TASK)
+
+# 本程序生成的片段文件名：{任务ID前8位}_segment_{5位序号}.ts
+_TS_SEGMENT_RE = re.compile(r'^[a-f0-9]{8}_segment_\d{5}\.ts$')
+
+# 从异常信息中提取HTTP状态码
+_HTTP_STATUS_RE = re.compile(r'HTTP.*?(\d{3})', re.IGNORECASE)
+
+
+def _derive_task_name(url: str) -> str:
+    """取链接最后一段路径（不含查询串和锚点）作为任务名，不是 .m3u8 文件时返回空串"""
+    tail = url.partition('?')[0].partition('#')[0].rpartition('/')[2]
+    return tail if tail.endswith('.m3u8') else ''
+
+
+@functools.lru_cache(maxsize=4096)
+def _path_exists(path: str) -> bool:
+    """带缓存的 os.path.exists，批量导入时同一路径只 stat 一次；每次导入结束后清空"""
+    return os.path.exists(path)
+
+
+def _file_decodes_as(filepath: str, encoding: str) -> bool:
+    """按 1MB 分块严格解码整个文件，全部字节都能按该编码解码时返回 True（跨块的多字节字符也能正确处理）"""
+    with open(filepath, 'rb') as f:
+        try:
+            for _ in codecs.iterdecode(iter(functools.partial(f.read, 1 << 20), b''), encoding):
+                pass
+        except UnicodeDecodeError:
+            return False
+    return True
+
+
+def _scan_m3u8(content: str):
+    """
+    单次遍历 M3U8 内容，同时找出子 M3U8 链接行和 TS 片段行
+    
+    返回 (子M3U8行列表, [(行号, TS行), ...])，行均为去掉首尾空白的原始文本，
+    由调用方按当前 base_url 拼成完整链接；行号用于生成与以往一致的片段文件名。
+    """
+    sub_lines = []
+    ts_lines = []
+    for index, line in enumerate(content.split('\n')):
+        line = line.strip()
+        if not line or line[0] == '#':
+            continue
+        if '.m3u8' in line:
+            sub_lines.append(line)
+        if line.endswith('.ts'):
+            ts_lines.append((index, line))
+    return sub_lines, ts_lines
+
+
+def _resolve_segment_url(base_url: str, line: str) -> str:
+    """
+    把播放列表中的一行解析为完整链接（base_url 总是以 / 结尾）
+    
+    绝大多数片段行是不含 ./、../ 和协议的普通相对路径，直接拼接即可，
+    只有以 / 或 . 开头、含点号路径段或冒号的行才交给 urljoin 处理。
+    """
+    if line.startswith('http'):
+        return line
+    if line[0] in './' or '/.' in line or ':' in line:
+        return urljoin(base_url, line)
+    return base_url + line
+
+
+# 模拟浏览器的公共请求头（Referer 由 _browser_referer 按链接单独生成）
+_BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': '*/*',
+    'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'Connection': 'keep-alive',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin',
+    'Cache-Control': 'no-cache',
+    'Pragma': 'no-cache'
+}
+
+
+@functools.lru_cache(maxsize=256)
+def _browser_referer(scheme: str, netloc: str, path_dir: Optional[str], is_media: bool) -> str:
+    """
+    生成 Referer：默认为站点根地址；M3U8/TS 链接使用其所在目录
+    
+    path_dir 为路径中最后一个 / 之前的部分，路径不含 / 时为 None
+    """
+    base_url = f"{scheme}://{netloc}"
+    if is_media and path_dir is not None:
+        return f"{base_url}/{path_dir}/"
+    return base_url
+
+
+# format_size 使用的单位表：由字节数的二进制位数直接算出单位下标
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB')
+_SIZE_DIVISORS = tuple(1 << (10 * i) for i in range(len(_SIZE_UNITS)))
+
+
+# 任务列表进度条：20 格，每格 5%，所有可能的形态预先生成
+_PROGRESS_BARS = tuple("█" * i + "░" * (20 - i) for i in range(21))
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_size(bytes_size) -> str:
+    """格式化文件大小（带缓存：任务列表每次刷新会反复格式化相同的总大小）"""
+    if bytes_size < 1024:
+        return f"{bytes_size} B"
+    idx = min((int(bytes_size).bit_length() - 1) // 10, len(_SIZE_UNITS) - 1)
+    return f"{bytes_size / _SIZE_DIVISORS[idx]:.2f} {_SIZE_UNITS[idx]}"
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_seconds(total_seconds: int) -> str:
+    """把非负整数秒格式化为 1h 2m 3s 形式（带缓存，同一秒内各行的运行时间相同）"""
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    
+    if hours > 0:
+        return f"{hours}h {minutes}m {seconds}s"
+    elif minutes > 0:
+        return f"{minutes}m {seconds}s"
+    else:
+        return f"{seconds}s"
+
+
+def _create_http_session(pool_maxsize: int = 64) -> requests.Session:
+    """
+    创建供下载回调复用的 HTTP 会话
+    
+    同一个 M3U8 的数百个片段几乎都来自同一主机，共享连接池可以省去每个片段的
+    TCP/TLS 握手；片段级重试仍由调用方自己的循环负责，这里只重试连接错误。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=3, backoff_factor=0.3)
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+@dataclass
+class DownloadConfig:
+    """下载配置"""
+    speed_limit: int = 0
+    default_thread_count: int = 8
+    default_retry_count: int = 5
+
+
+@dataclass
+class ProxyConfig:
+    """代理配置"""
+    enabled: bool = False
+    http_proxy: str = ''
+    https_proxy: str = ''
+    username: str = ''
+    password: str = ''
+
+
+@dataclass
+class Config:
+    """应用配置"""
+    download: DownloadConfig = field(default_factory=DownloadConfig)
+    proxy: ProxyConfig = field(default_factory=ProxyConfig)
+
 
 class ConfigManager:
     """简单的配置管理器"""
     
     def __init__(self):
-        self.config = {
-            'download': {
-                'speed_limit': 0,
-                'default_thread_count': 8,
-                'default_retry_count': 5
-            },
-            'proxy': {
-                'enabled': False,
-                'http_proxy': '',
-                'https_proxy': '',
-                'username': '',
-                'password': ''
-            }
-        }
+        self._config = Config()
     
-    def get_config(self):
-        """获取配置"""
-        class Config:
-            def __init__(self, config_dict):
-                self.download = type('DownloadConfig', (), config_dict['download'])()
-                self.proxy = type('ProxyConfig', (), config_dict['proxy'])()
-        
-        return Config(self.config)
+    def get_config(self) -> Config:
+        """获取配置（始终返回同一个对象，更新配置时原地修改）"""
+        return self._config
     
     def update_download_config(self, speed_limit=0, default_thread_count=8, default_retry_count=5):
         """更新下载配置"""
-        self.config['download']['speed_limit'] = speed_limit
-        self.config['download']['default_thread_count'] = default_thread_count
-        self.config['download']['default_retry_count'] = default_retry_count
+        download = self._config.download
+        download.speed_limit = speed_limit
+        download.default_thread_count = default_thread_count
+        download.default_retry_count = default_retry_count
     
     def update_proxy_config(self, enabled=False, http_proxy='', https_proxy='', username='', password=''):
         """更新代理配置"""
-        self.config['proxy']['enabled'] = enabled
-        self.config['proxy']['http_proxy'] = http_proxy
-        self.config['proxy']['https_proxy'] = https_proxy
-        self.config['proxy']['username'] = username
-        self.config['proxy']['password'] = password
+        proxy = self._config.proxy
+        proxy.enabled = enabled
+        proxy.http_proxy = http_proxy
+        proxy.https_proxy = https_proxy
+        proxy.username = username
+        proxy.password = password
 
 
 class ModernM3U8DownloaderApp:
     """现代化 M3U8 下载器应用"""
     
+    # 任务列表中各状态的显示文本和前景色；每种状态对应一个固定的行标签，在创建列表时统一配置
+    _STATUS_STYLES = {
+        TaskStatus.PENDING: ("⏳ 等待中", "#9E9E9E"),
+        TaskStatus.DOWNLOADING: ("🔄 下载中", "#2196F3"),
+        TaskStatus.PAUSED: (TaskStatus.PAUSED.value, "black"),
+        TaskStatus.COMPLETED: ("✓ 已完成", "#4CAF50"),
+        TaskStatus.FAILED: ("✗ 失败", "#F44336"),
+        TaskStatus.STOPPED: ("⏹ 已停止", "#FF9800"),
+    }
+    _STATUS_TAGS = {status: f"status_{status.name.lower()}" for status in TaskStatus}
+    
+    # 读取本地文本文件时依次尝试的常见编码
+    _FILE_ENCODINGS = ('utf-8', 'gbk', 'gb2312', 'gb18030', 'big5', 'shift_jis', 'euc-jp', 'euc-kr', 'iso-8859-1')
+    
     def __init__(self, root):
         self.root = root
         self.root.title("M3U8 下载器 Pro")
@@ -100,6 +281,11 @@ class ModernM3U8DownloaderApp:
         # 初始化配置管理器
         self.config_manager = ConfigManager()
         
+        # 日志先写入有界缓冲区（任何线程都可调用），由界面线程定时批量写入文本框
+        self._log_queue = deque(maxlen=5000)
+        self._log_lock = threading.Lock()
+        self._log_max_lines = 10000  # 日志文本框最多保留的行数
+        
         # 尝试设置图标
         self.set_icon()
         
@@ -107,17 +293,32 @@ class ModernM3U8DownloaderApp:
         self.setup_theme()
         
         # 初始化下载队列管理器
+        # 下载回调（M3U8获取和传统下载路径）共用的会话，连接池大小按 最大并发任务数 × 默认每任务线程数 计算
+        download_config = self.config_manager.get_config().download
+        self.http_session = _create_http_session(
+            pool_maxsize=_MAX_CONCURRENT_TASKS * download_config.default_thread_count
+        )
         self.download_queue = DownloadQueue(task_manager, max_concurrent=3)
         self.download_queue.set_download_callback(self.download_m3u8_task)
         
+        # 根据实测吞吐量自动调整同时下载的任务数（状态栏"队列"显示当前上限），上限受连接预算约束
+        self.concurrency_controller = AdaptiveConcurrencyController(
+            self.download_queue, task_manager, max_limit=_MAX_CONCURRENT_TASKS
+        )
+        self.concurrency_controller.start()
+        
         # 初始化优化下载池
-        self.download_pool = DownloadPool(pool_size=5, max_speed=None)
+        self.download_pool = DownloadPool(pool_size=5, max_speed=None, session=self.http_session)
+        
+        # 片段写缓冲区池，由批量下载器的所有调度器共用
+        self.buffer_pool = BufferPool()
         
         # 初始化高级批量下载器 - 支持智能并发控制
         self.batch_downloader = get_batch_downloader(
-            max_concurrent_tasks=3,
-            max_concurrent_downloads_per_task=15,  # 增加每个任务的并发数
-            log_callback=self.log_message  # 传递日志回调函数
+            max_concurrent_tasks=_MAX_CONCURRENT_TASKS,  # 与并发控制器的上限一致，共享连接池按此申请
+            max_concurrent_downloads_per_task=_DOWNLOADS_PER_TASK,
+            log_callback=self.log_message,  # 传递日志回调函数
+            buffer_pool=self.buffer_pool
         )
         
         # 初始化智能下载调度器
@@ -127,19 +328,30 @@ class ModernM3U8DownloaderApp:
         
         # 创建界面
         self.create_widgets()
+        self.root.after(100, self._flush_logs)
         
         # 下载相关变量
-        self.download_thread = None
         self.is_downloading = False
         
-        # 添加任务管理器监听器
-        task_manager.add_listener(self.update_task_list)
+        # 任务列表增量刷新：缓存每行上次显示的内容，只更新变化的行
+        self._row_cache = {}  # {iid: values}
+        self._row_status_tag = {}  # {task_id: 状态行标签}
+        self._row_state = {}  # {task_id: 上次渲染时的任务原始状态}，未变化的任务跳过格式化
+        self._thread_node_ids = {}  # {task_id: 树中该任务下的线程节点集合}，插入/删除线程节点时同步维护
+        self._var_values = {}  # {变量名: 上次设置的值}，见 _set_var
+        self._known_iids = set()  # 树中现有的任务（父节点）
+        
+        # 界面由一个定时器统一刷新，任务/队列只在被标记为有变化时才重新读取
+        self._task_dirty = True
+        self._queue_dirty = True
+        self._running_count = 0
         
-        # 初始化时更新一次任务列表
-        self.update_task_list()
+        # 添加监听器：只做标记，可以在任意线程中被调用
+        task_manager.add_listener(self._mark_task_list_dirty)
+        self.download_queue.set_status_callback(self._mark_queue_dirty)
         
-        # 启动定时更新任务列表
-        self.auto_update_task_list()
+        # 启动界面定时刷新（首次立即刷新任务列表）
+        self._tick()
         
     def setup_theme(self):
         """设置应用主题"""
@@ -384,6 +596,8 @@ class ModernM3U8DownloaderApp:
             self.task_tree.tag_configure("running", foreground="#2196F3")
             self.task_tree.tag_configure("completed", foreground="#4CAF50")
             self.task_tree.tag_configure("failed", foreground="#f44336")
+            for status, (_, color) in self._STATUS_STYLES.items():
+                self.task_tree.tag_configure(self._STATUS_TAGS[status], foreground=color)
         except:
             pass
         
@@ -459,6 +673,8 @@ class ModernM3U8DownloaderApp:
 
         # 绑定右键事件
         self.task_tree.bind("<Button-3>", self._on_task_right_click)
+        # 展开任务时立即刷新其线程节点（折叠期间不刷新）
+        self.task_tree.bind("<<TreeviewOpen>>", self._on_task_tree_open)
         
     def create_log_section(self, parent):
         """创建日志区域"""
@@ -527,29 +743,43 @@ class ModernM3U8DownloaderApp:
         self.time_label = tk.Label(status_frame, textvariable=self.time_var, font=("Helvetica", 9), relief=tk.FLAT, padx=10, pady=5)
         self.time_label.grid(row=0, column=3, sticky=tk.E)
         
-        # 更新时间
-        self.update_time()
-        
-        # 更新队列状态
-        self.update_queue_status()
-        
-    def update_time(self):
-        """更新时间显示"""
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.time_var.set(current_time)
-        self.root.after(1000, self.update_time)
-        
-    def update_queue_status(self):
-        """更新队列状态显示"""
-        status = self.download_queue.get_queue_status()
-        queue_text = f"队列: {status['running_count']}/{status['max_concurrent']} (等待: {status['pending_count']})"
-        self.queue_var.set(queue_text)
-        self.root.after(1000, self.update_queue_status)
+    def _mark_task_list_dirty(self):
+        """任务变更监听器"""
+        self._task_dirty = True
+    
+    def _mark_queue_dirty(self):
+        """队列变更监听器"""
+        self._queue_dirty = True
+    
+    def _set_var(self, var, value):
+        """仅在值变化时设置 Tk 变量，避免重复触发变量跟踪和标签重新布局"""
+        name = str(var)
+        if self._var_values.get(name) != value:
+            self._var_values[name] = value
+            var.set(value)
+    
+    def _tick(self):
+        """
+        界面定时刷新（每500毫秒）
         
-    def auto_update_task_list(self):
-        """自动更新任务列表"""
-        self.update_task_list()
-        self.root.after(1000, self.auto_update_task_list)
+        时间每次都更新；队列状态只在队列变化后读取；任务列表在有变化或有任务
+        正在下载时刷新（下载中的线程节点和运行时间会持续变化）
+        """
+        try:
+            self._set_var(self.time_var, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            
+            if self._queue_dirty:
+                self._queue_dirty = False
+                status = self.download_queue.get_queue_status()
+                self._running_count = status['running_count']
+                queue_text = f"队列: {status['running_count']}/{status['max_concurrent']} (等待: {status['pending_count']})"
+                self._set_var(self.queue_var, queue_text)
+            
+            if self._task_dirty or self._running_count:
+                self._task_dirty = False
+                self.update_task_list()
+        finally:
+            self.root.after(500, self._tick)
         
     def browse_folder(self):
         """浏览文件夹"""
@@ -569,14 +799,37 @@ class ModernM3U8DownloaderApp:
             self.url_entry.insert(0, file_selected)
             
     def log_message(self, message):
-        """记录日志"""
+        """记录日志（只入缓冲区，不直接操作界面，可在下载线程中调用）"""
         timestamp = datetime.now().strftime("%H:%M:%S")
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        with self._log_lock:
+            self._log_queue.append(f"[{timestamp}] {message}\n")
+    
+    def _drain_log_queue(self):
+        """把缓冲区中的日志一次性写入文本框"""
+        with self._log_lock:
+            if not self._log_queue:
+                return
+            lines = list(self._log_queue)
+            self._log_queue.clear()
+        
+        self.log_text.insert(tk.END, "".join(lines))
+        # 限制文本框行数，避免长时间下载后占用过多内存
+        line_count = int(self.log_text.index("end-1c").split('.')[0])
+        if line_count > self._log_max_lines:
+            self.log_text.delete("1.0", f"end-{self._log_max_lines} lines")
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
+    
+    def _flush_logs(self):
+        """定时刷新日志显示"""
+        try:
+            self._drain_log_queue()
+        finally:
+            self.root.after(100, self._flush_logs)
         
     def clear_log(self):
         """清空日志"""
+        with self._log_lock:
+            self._log_queue.clear()
         self.log_text.delete(1.0, tk.END)
         
     def export_log(self):
@@ -587,6 +840,7 @@ class ModernM3U8DownloaderApp:
                 filetypes=[("日志文件", "*.log"), ("文本文件", "*.txt"), ("所有文件", "*.*")]
             )
             if file_path:
+                self._drain_log_queue()
                 with open(file_path, 'w', encoding='utf-8') as f:
                     f.write(self.log_text.get(1.0, tk.END))
                 self.log_message(f"✓ 日志已导出: {file_path}")
@@ -596,14 +850,7 @@ class ModernM3U8DownloaderApp:
         
     def format_size(self, bytes_size):
         """格式化文件大小"""
-        if bytes_size < 1024:
-            return f"{bytes_size} B"
-        elif bytes_size < 1024 * 1024:
-            return f"{bytes_size / 1024:.2f} KB"
-        elif bytes_size < 1024 * 1024 * 1024:
-            return f"{bytes_size / (1024 * 1024):.2f} MB"
-        else:
-            return f"{bytes_size / (1024 * 1024 * 1024):.2f} GB"
+        return _format_size(bytes_size)
         
     def add_download_task(self):
         """添加下载任务"""
@@ -628,9 +875,7 @@ class ModernM3U8DownloaderApp:
             name = os.path.basename(url)
         else:
             # 网络链接
-            name = url.split('/')[-1].split('?')[0] or "未知任务"
-            if not name.endswith('.m3u8'):
-                name = "M3U8 下载任务"
+            name = _derive_task_name(url) or "M3U8 下载任务"
         
         # 添加时间戳到任务名，防止同一链接重复下载时无法区分
         from datetime import datetime
@@ -643,7 +888,7 @@ class ModernM3U8DownloaderApp:
         self.download_queue.add_to_queue(task_id)
         
         self.log_message(f"✓ 已添加下载任务到队列: {name_with_time}")
-        self.status_var.set("已添加下载任务到队列")
+        self._set_var(self.status_var, "已添加下载任务到队列")
         
         # 清空输入框
         self.url_entry.delete(0, tk.END)
@@ -663,62 +908,90 @@ class ModernM3U8DownloaderApp:
             return
         
         try:
-            # 使用自动编码检测读取文件
-            lines = self._read_file_with_encoding(file_path).splitlines()
-            
-            # 解析文件内容
-            imported_count = 0
+            # 界面控件只能在主线程读取
             default_folder = self.folder_entry.get().strip()
             thread_count = int(self.thread_var.get())
             retry_count = int(self.retry_var.get())
             auto_merge = self.auto_merge_var.get()
-            
-            for line in lines:
-                line = line.strip()
-                
-                # 跳过空行和注释
-                if not line or line.startswith('#'):
-                    continue
-                
-                # 支持格式：URL 或 URL|文件夹
-                parts = line.split('|')
-                url = parts[0].strip()
-                folder = parts[1].strip() if len(parts) > 1 else default_folder
-                
-                # 验证URL或文件路径
-                if not (url.startswith('http://') or url.startswith('https://') or os.path.exists(url)):
-                    self.log_message(f"⚠ 跳过无效链接: {url}")
-                    continue
-                
-                # 生成任务名
-                if os.path.exists(url):
-                    name = os.path.basename(url)
-                else:
-                    name = url.split('/')[-1].split('?')[0] or "批量导入任务"
-                    if not name.endswith('.m3u8'):
-                        name = f"批量导入_{imported_count + 1}"
-                
-                # 添加时间戳到任务名，防止同一链接重复下载时无法区分
-                from datetime import datetime
-                timestamp = datetime.now().strftime("_%Y%m%d_%H%M%S")
-                name_with_time = name + timestamp
-                
-                # 添加任务
-                task_id = task_manager.add_task(url, folder, thread_count, retry_count, auto_merge, name_with_time)
-                self.download_queue.add_to_queue(task_id)
-                imported_count += 1
-            
-            if imported_count > 0:
-                self.log_message(f"✓ 已批量导入 {imported_count} 个任务")
-                self.status_var.set(f"已批量导入 {imported_count} 个任务")
-                messagebox.showinfo("批量导入", f"成功导入 {imported_count} 个下载任务！")
-            else:
-                self.log_message("⚠ 未找到有效的任务链接")
-                messagebox.showwarning("批量导入", "未找到有效的任务链接！")
-                
         except Exception as e:
             self.log_message(f"✗ 批量导入失败: {str(e)}")
             messagebox.showerror("批量导入错误", f"导入失败: {str(e)}")
+            return
+        
+        self._set_var(self.status_var, "正在批量导入任务...")
+        import_thread = threading.Thread(
+            target=self._batch_import_thread,
+            args=(file_path, default_folder, thread_count, retry_count, auto_merge)
+        )
+        import_thread.daemon = True
+        import_thread.start()
+    
+    def _batch_import_thread(self, file_path, default_folder, thread_count, retry_count, auto_merge):
+        """批量导入的线程函数，逐行解析文件，避免大文件阻塞界面"""
+        try:
+            imported_count = 0
+            imported_task_ids = []
+            
+            # 按检测到的编码逐行读取，不把整个文件读成一个字符串再拆分
+            with self._open_with_detected_encoding(file_path) as f:
+                for line_no, line in enumerate(f, 1):
+                    if line_no % 10000 == 0:
+                        self.log_message(f"… 已解析 {line_no} 行，导入 {imported_count} 个任务")
+                    
+                    line = line.strip()
+                    
+                    # 跳过空行和注释
+                    if not line or line.startswith('#'):
+                        continue
+                    
+                    # 支持格式：URL 或 URL|文件夹
+                    url, _, folder = line.partition('|')
+                    url = url.strip()
+                    folder = folder.partition('|')[0].strip() or default_folder
+                    
+                    # 验证URL或文件路径，本地文件只检查一次
+                    is_http = url.startswith(_HTTP_PREFIXES)
+                    is_local = not is_http and _path_exists(url)
+                    if not (is_http or is_local):
+                        self.log_message(f"⚠ 跳过无效链接: {url}")
+                        continue
+                    
+                    # 生成任务名
+                    if is_local:
+                        name = os.path.basename(url)
+                    else:
+                        name = _derive_task_name(url) or f"批量导入_{imported_count + 1}"
+                    
+                    # 添加时间戳到任务名，防止同一链接重复下载时无法区分
+                    timestamp = datetime.now().strftime("_%Y%m%d_%H%M%S")
+                    name_with_time = name + timestamp
+                    
+                    # 添加任务（导入完成后统一入队）
+                    task_id = task_manager.add_task(url, folder, thread_count, retry_count, auto_merge, name_with_time)
+                    imported_task_ids.append(task_id)
+                    imported_count += 1
+            
+            self.download_queue.add_tasks_to_queue(imported_task_ids)
+            self.root.after(0, lambda: self._finish_batch_import(imported_count))
+                
+        except Exception as e:
+            error = str(e)
+            self.log_message(f"✗ 批量导入失败: {error}")
+            self.root.after(0, lambda: messagebox.showerror("批量导入错误", f"导入失败: {error}"))
+        finally:
+            # 文件可能在两次导入之间被创建或删除，不跨导入复用结果
+            _path_exists.cache_clear()
+    
+    def _finish_batch_import(self, imported_count):
+        """在主线程中提示批量导入结果"""
+        if imported_count > 0:
+            self.log_message(f"✓ 已批量导入 {imported_count} 个任务")
+            self._set_var(self.status_var, f"已批量导入 {imported_count} 个任务")
+            messagebox.showinfo("批量导入", f"成功导入 {imported_count} 个下载任务！")
+        else:
+            self._set_var(self.status_var, "未找到有效的任务链接")
+            self.log_message("⚠ 未找到有效的任务链接")
+            messagebox.showwarning("批量导入", "未找到有效的任务链接！")
             
     def start_selected_task(self):
         """开始选中的任务"""
@@ -733,7 +1006,7 @@ class ModernM3U8DownloaderApp:
             # 将任务添加到下载队列
             self.download_queue.add_to_queue(task_id)
             self.log_message(f"▶ 已将任务添加到队列: {task.name}")
-            self.status_var.set("任务已添加到队列")
+            self._set_var(self.status_var, "任务已添加到队列")
             
     def stop_selected_task(self):
         """停止选中的任务"""
@@ -748,7 +1021,7 @@ class ModernM3U8DownloaderApp:
             # 从队列中移除任务
             self.download_queue.remove_from_queue(task_id)
             self.log_message(f"⏹ 已停止任务: {task.name}")
-            self.status_var.set("任务已停止")
+            self._set_var(self.status_var, "任务已停止")
             
     def remove_selected_task(self):
         """移除选中的任务"""
@@ -762,20 +1035,16 @@ class ModernM3U8DownloaderApp:
         if task:
             task_manager.remove_task(task_id)
             self.log_message(f"🗑 已移除任务: {task.name}")
-            self.status_var.set("任务已移除")
+            self._set_var(self.status_var, "任务已移除")
             
     def clear_completed_tasks(self):
         """清除已完成的任务"""
-        tasks = task_manager.get_all_tasks()
-        completed_count = 0
-        for task in tasks:
-            if task.status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.STOPPED]:
-                task_manager.remove_task(task.task_id)
-                completed_count += 1
-                
+        completed_ids = [task.task_id for task in task_manager.get_all_tasks() if task.status in FINISHED_STATUSES]
+        completed_count = len(completed_ids)
         if completed_count > 0:
+            task_manager.remove_tasks(completed_ids)
             self.log_message(f"✓ 已清除 {completed_count} 个已完成的任务")
-            self.status_var.set(f"已清除 {completed_count} 个任务")
+            self._set_var(self.status_var, f"已清除 {completed_count} 个任务")
         else:
             self.log_message("没有已完成的任务")
             
@@ -836,57 +1105,29 @@ class ModernM3U8DownloaderApp:
         
         history_tree.pack(fill=tk.BOTH, expand=True)
         
-        # 加载历史记录
-        history_tasks = task_manager.get_history()
+        # 在后台线程读取历史文件并格式化各行，再分批插入列表，避免阻塞界面
+        def load_history():
+            rows = self._build_history_rows(task_manager.get_history())
+            self.root.after(0, lambda: show_history(rows))
         
-        if not history_tasks:
-            # 空记录提示
-            empty_label = ttk.Label(
-                main_frame,
-                text="暂无历史记录",
-                font=("Helvetica", 12),
-                foreground="#9E9E9E"
-            )
-            empty_label.pack(pady=20)
-        else:
-            # 添加历史记录到列表
-            for task in reversed(history_tasks):  # 最新的显示在最前面
-                # 格式化大小
-                size_str = ""
-                if task.total_bytes > 0:
-                    size_str = self.format_size(task.total_bytes)
-                elif task.downloaded_bytes > 0:
-                    size_str = self.format_size(task.downloaded_bytes)
-                
-                # 格式化完成时间
-                time_str = ""
-                if task.end_time > 0:
-                    time_str = datetime.fromtimestamp(task.end_time).strftime("%Y-%m-%d %H:%M:%S")
-                
-                # 格式化耗时
-                duration_str = ""
-                if task.start_time > 0 and task.end_time > 0:
-                    duration = task.end_time - task.start_time
-                    duration_str = self.format_duration(duration)
-                
-                # 截断URL显示
-                url_display = task.url
-                if len(url_display) > 50:
-                    url_display = url_display[:47] + "..."
-                
-                # 截断文件夹显示
-                folder_display = task.folder
-                if len(folder_display) > 40:
-                    folder_display = folder_display[:37] + "..."
-                
-                history_tree.insert("", tk.END, values=(
-                    task.name,
-                    url_display,
-                    folder_display,
-                    size_str,
-                    time_str,
-                    duration_str
-                ), tags=(task.task_id,))
+        def show_history(rows):
+            if not history_tree.winfo_exists():
+                return  # 窗口已关闭
+            if rows:
+                self._insert_history_batch(history_tree, rows, 0)
+            else:
+                # 空记录提示
+                empty_label = ttk.Label(
+                    main_frame,
+                    text="暂无历史记录",
+                    font=("Helvetica", 12),
+                    foreground="#9E9E9E"
+                )
+                empty_label.pack(pady=20, after=history_frame)
+        
+        history_thread = threading.Thread(target=load_history)
+        history_thread.daemon = True
+        history_thread.start()
 
         # 绑定双击事件 - 双击重新添加任务
         history_tree.bind("<Double-1>", lambda e: self._on_history_double_click(e, history_tree))
@@ -911,15 +1152,27 @@ class ModernM3U8DownloaderApp:
         )
         close_btn.pack(side=tk.LEFT)
         
+    def _on_task_tree_open(self, event):
+        """任务行展开时刷新线程节点（事件在行被标记为展开之前触发，因此强制刷新）"""
+        item = self.task_tree.focus()
+        if item in self._known_iids:
+            self._update_thread_nodes(item, force=True)
+    
     def _on_task_right_click(self, event):
         """处理任务列表右键点击事件"""
-        # 获取点击位置的项
+        # 获取点击位置的项（每次事件只查询一次）
         item = self.task_tree.identify_row(event.y)
-        if item:
-            # 选中该项
-            self.task_tree.selection_set(item)
-            # 显示右键菜单
-            self.task_context_menu.post(event.x_root, event.y_root)
+        if not item:
+            return
+        # 点在线程子节点上时，菜单操作的对象是它所属的任务
+        item = self.task_tree.parent(item) or item
+        # 选中该项
+        self.task_tree.selection_set(item)
+        # 显示右键菜单，点击菜单外部时自动关闭
+        try:
+            self.task_context_menu.tk_popup(event.x_root, event.y_root)
+        finally:
+            self.task_context_menu.grab_release()
 
     def _show_task_m3u8_link(self):
         """显示选中任务的M3U8链接"""
@@ -1045,8 +1298,8 @@ class ModernM3U8DownloaderApp:
         )
         details_text.pack(fill=tk.BOTH, expand=True)
 
-        # 插入任务详情
-        details_info = f"""任务ID: {task.task_id}
+        # 插入任务详情（各部分收集到列表中，最后一次拼接并插入）
+        details_parts = [f"""任务ID: {task.task_id}
 任务名称: {task.name}
 下载链接: {task.url}
 下载位置: {task.folder}
@@ -1058,25 +1311,23 @@ class ModernM3U8DownloaderApp:
 已下载大小: {self.format_size(task.downloaded_bytes)}
 总大小: {self.format_size(task.total_bytes) if task.total_bytes > 0 else '未知'}
 下载速度: {task.speed}
-预计剩余时间: {task.eta}"""
+预计剩余时间: {task.eta}"""]
 
         if task.start_time > 0:
-            from datetime import datetime
             start_time_str = datetime.fromtimestamp(task.start_time).strftime("%Y-%m-%d %H:%M:%S")
-            details_info += f"\n开始时间: {start_time_str}"
+            details_parts.append(f"\n开始时间: {start_time_str}")
 
         if task.end_time > 0:
-            from datetime import datetime
             end_time_str = datetime.fromtimestamp(task.end_time).strftime("%Y-%m-%d %H:%M:%S")
             duration = task.end_time - task.start_time
-            details_info += f"\n结束时间: {end_time_str}"
-            details_info += f"\n总耗时: {self.format_duration(duration)}"
+            details_parts.append(f"\n结束时间: {end_time_str}")
+            details_parts.append(f"\n总耗时: {self.format_duration(duration)}")
 
         if task.error_message:
-            details_info += f"\n错误信息: {task.error_message}"
+            details_parts.append(f"\n错误信息: {task.error_message}")
 
         details_text.config(state=tk.NORMAL)
-        details_text.insert(tk.END, details_info)
+        details_text.insert(tk.END, "".join(details_parts))
         details_text.config(state=tk.DISABLED)
 
         # 文件列表框架（如果有下载的文件）
@@ -1095,36 +1346,40 @@ class ModernM3U8DownloaderApp:
 
             # 查找下载的文件
             try:
-                files_info = ""
+                files_parts = []
                 if os.path.exists(task.folder):
-                    files = os.listdir(task.folder)
-                    ts_files = [f for f in files if f.endswith('.ts') and f.startswith(f"{task_id[:8]}_segment_")]
-                    mp4_files = [f for f in files if f.endswith('.mp4') and task.name in f]
+                    # 一次目录扫描同时拿到文件名和大小，不再对每个文件单独 exists + getsize
+                    ts_files, mp4_files = [], []
+                    ts_prefix = f"{task_id[:8]}_segment_"
+                    with os.scandir(task.folder) as entries:
+                        for entry in entries:
+                            name = entry.name
+                            if name.endswith('.ts') and name.startswith(ts_prefix):
+                                target = ts_files
+                            elif name.endswith('.mp4') and task.name in name:
+                                target = mp4_files
+                            else:
+                                continue
+                            if entry.is_file():
+                                target.append((name, entry.stat().st_size))
 
                     if mp4_files:
-                        files_info += "合并后的MP4文件:\n"
-                        for mp4_file in mp4_files:
-                            file_path = os.path.join(task.folder, mp4_file)
-                            if os.path.exists(file_path):
-                                size = os.path.getsize(file_path)
-                                files_info += f"  • {mp4_file} ({self.format_size(size)})\n"
+                        files_parts.append("合并后的MP4文件:\n")
+                        for mp4_file, size in mp4_files:
+                            files_parts.append(f"  • {mp4_file} ({self.format_size(size)})\n")
 
                     if ts_files:
-                        files_info += f"\nTS片段文件 ({len(ts_files)} 个):\n"
-                        total_size = 0
-                        for i, ts_file in enumerate(sorted(ts_files)[:5]):  # 只显示前5个
-                            file_path = os.path.join(task.folder, ts_file)
-                            if os.path.exists(file_path):
-                                size = os.path.getsize(file_path)
-                                total_size += size
-                                files_info += f"  • {ts_file} ({self.format_size(size)})\n"
+                        ts_files.sort()
+                        files_parts.append(f"\nTS片段文件 ({len(ts_files)} 个):\n")
+                        for ts_file, size in ts_files[:5]:  # 只显示前5个
+                            files_parts.append(f"  • {ts_file} ({self.format_size(size)})\n")
 
                         if len(ts_files) > 5:
-                            files_info += f"  ... 还有 {len(ts_files) - 5} 个文件\n"
-                            files_info += f"  总大小: {self.format_size(total_size)}\n"
+                            total_size = sum(size for _, size in ts_files)
+                            files_parts.append(f"  ... 还有 {len(ts_files) - 5} 个文件\n")
+                            files_parts.append(f"  总大小: {self.format_size(total_size)}\n")
 
-                if not files_info:
-                    files_info = "未找到相关文件"
+                files_info = "".join(files_parts) or "未找到相关文件"
 
                 files_text.config(state=tk.NORMAL)
                 files_text.insert(tk.END, files_info)
@@ -1196,6 +1451,43 @@ class ModernM3U8DownloaderApp:
         except Exception as e:
             messagebox.showerror("错误", f"打开浏览器失败：{str(e)}")
 
+    def _build_history_rows(self, history_tasks):
+        """把历史任务格式化为列表行（可在后台线程执行），最新的排在最前面"""
+        rows = []
+        for task in reversed(history_tasks):
+            # 格式化大小
+            size = task.total_bytes or task.downloaded_bytes
+            size_str = self.format_size(size) if size > 0 else ""
+            
+            # 格式化完成时间
+            time_str = ""
+            if task.end_time > 0:
+                time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(task.end_time))
+            
+            # 格式化耗时
+            duration_str = ""
+            if task.start_time > 0 and task.end_time > 0:
+                duration_str = self.format_duration(task.end_time - task.start_time)
+            
+            # 截断URL和文件夹显示
+            url = task.url
+            url_display = url if len(url) <= 50 else f"{url:.47}..."
+            folder = task.folder
+            folder_display = folder if len(folder) <= 40 else f"{folder:.37}..."
+            
+            rows.append((task.task_id, (task.name, url_display, folder_display, size_str, time_str, duration_str)))
+        return rows
+    
+    def _insert_history_batch(self, tree, rows, start, batch_size=200):
+        """分批向历史列表插入行，每批之间让出事件循环"""
+        if not tree.winfo_exists():
+            return  # 窗口已关闭
+        end = min(start + batch_size, len(rows))
+        for task_id, values in rows[start:end]:
+            tree.insert("", tk.END, values=values, tags=(task_id,))
+        if end < len(rows):
+            self.root.after(1, lambda: self._insert_history_batch(tree, rows, end, batch_size))
+    
     def _on_history_double_click(self, event, history_tree):
         """处理历史记录双击事件 - 重新添加任务"""
         # 获取选中的项
@@ -1269,151 +1561,136 @@ class ModernM3U8DownloaderApp:
 
             messagebox.showinfo("成功", "历史记录已清除")
             
+    def _render_row(self, parent, iid, text, values):
+        """插入新行，或仅在显示内容变化时更新已有行"""
+        if iid not in self._row_cache:
+            self.task_tree.insert(parent, tk.END, iid=iid, text=text, values=values)
+        elif self._row_cache[iid] != values:
+            self.task_tree.item(iid, values=values)
+        else:
+            return
+        self._row_cache[iid] = values
+    
+    def _delete_row(self, iid):
+        """删除行及其子节点，同时清理缓存"""
+        for child in self._thread_node_ids.pop(iid, ()):
+            self._row_cache.pop(child, None)
+        self._row_cache.pop(iid, None)
+        self.task_tree.delete(iid)
+    
     def update_task_list(self):
-        """更新任务列表显示 - 支持显示每个下载线程的进度"""
-        # 保存当前选中项和展开状态
-        selected = self.task_tree.selection()
-        expanded_items = set()
-        for item in self.task_tree.get_children():
-            if self.task_tree.item(item).get('open'):
-                expanded_items.add(item)
-        
+        """更新任务列表显示 - 支持显示每个下载线程的进度（只更新有变化的行）"""
         # 获取所有任务
         tasks = task_manager.get_all_tasks()
         task_ids = {task.task_id for task in tasks}
         
-        # 获取当前树中的所有项（包括父节点和子节点）
-        all_items = set()
-        for item in self.task_tree.get_children():
-            all_items.add(item)
-            # 获取子节点
-            for child in self.task_tree.get_children(item):
-                all_items.add(child)
-        
-        # 删除不再存在的任务
-        for item in all_items - task_ids:
-            self.task_tree.delete(item)
+        # 删除不再存在的任务（子节点随父节点一起删除）
+        for item in self._known_iids - task_ids:
+            if self.task_tree.exists(item):
+                self._delete_row(item)
+            self._row_cache.pop(item, None)
+            self._row_status_tag.pop(item, None)
+            self._row_state.pop(item, None)
+            self._thread_node_ids.pop(item, None)
+        self._known_iids = task_ids
         
         # 更新或添加任务
+        now = time.time()
         for task in tasks:
-            # 创建进度条文本
-            progress_bar = self.create_progress_bar(task.progress)
-            
-            # 格式化大小
-            size_str = ""
-            if task.total_bytes > 0:
-                size_str = f"{self.format_size(task.downloaded_bytes)} / {self.format_size(task.total_bytes)}"
-            elif task.downloaded_bytes > 0:
-                size_str = f"{self.format_size(task.downloaded_bytes)}"
-            
-            # 状态图标和颜色
-            status_text = task.status.value
-            status_color = "black"
-            if task.status == TaskStatus.DOWNLOADING:
-                status_text = f"🔄 下载中"
-                status_color = "#2196F3"
-            elif task.status == TaskStatus.COMPLETED:
-                status_text = f"✓ 已完成"
-                status_color = "#4CAF50"
-            elif task.status == TaskStatus.FAILED:
-                status_text = f"✗ 失败"
-                status_color = "#F44336"
-            elif task.status == TaskStatus.STOPPED:
-                status_text = f"⏹ 已停止"
-                status_color = "#FF9800"
-            elif task.status == TaskStatus.PENDING:
-                status_text = f"⏳ 等待中"
-                status_color = "#9E9E9E"
-            
-            # 格式化时间
-            time_str = ""
-            if task.start_time > 0:
-                if task.end_time > 0:
-                    # 已完成
-                    duration = task.end_time - task.start_time
-                    time_str = f"耗时: {self.format_duration(duration)}"
-                else:
-                    # 进行中
-                    duration = time.time() - task.start_time
-                    time_str = f"已运行: {self.format_duration(duration)}"
-            
-            # 检查任务是否已存在于树中
-            task_exists = self.task_tree.exists(task.task_id)
-            
-            if not task_exists:
-                # 插入新任务作为父节点
-                item_index = len(self.task_tree.get_children())
-                tags = (f"status_{task.task_id}",)
-                if item_index % 2 == 0:
-                    tags = tags + ("evenrow",)
-                else:
-                    tags = tags + ("oddrow",)
-                    
-                self.task_tree.insert("", tk.END, iid=task.task_id, text="📁", values=(
-                    task.name,
-                    status_text,
-                    progress_bar,
-                    task.speed,
-                    task.eta,
-                    size_str,
-                    time_str
-                ), open=False, tags=tags)
-            else:
-                # 更新现有任务
-                self.task_tree.item(task.task_id, text="📁", values=(
-                    task.name,
-                    status_text,
-                    progress_bar,
-                    task.speed,
-                    task.eta,
-                    size_str,
-                    time_str
-                ))
-            
-            # 设置状态颜色
-            try:
-                self.task_tree.tag_configure(f"status_{task.task_id}", foreground=status_color)
-                self.task_tree.item(task.task_id, tags=(f"status_{task.task_id}",))
-            except Exception:
-                pass
-            
-            # 如果是下载中状态，添加线程子节点
+            # 键由行中显示的字段组成，进度取显示精度 0.1%，运行时间取整秒。
+            # 下载中的任务字节数、速度几乎每次刷新都会变化，仍会重新格式化；
+            # 跳过的主要是内容不变的等待、暂停和已结束任务
+            running_seconds = int(now - task.start_time) if task.start_time > 0 and task.end_time <= 0 else 0
+            state = (task.status, task.name, round(task.progress * 10), task.downloaded_bytes, task.total_bytes,
+                     task.speed, task.eta, task.start_time, task.end_time, running_seconds)
+            if self._row_state.get(task.task_id) != state:
+                self._row_state[task.task_id] = state
+                self._render_task_row(task, now)
+            
+            # 如果是下载中状态，刷新线程子节点
             if task.status == TaskStatus.DOWNLOADING:
                 self._update_thread_nodes(task.task_id)
+    
+    def _render_task_row(self, task, now):
+        """格式化并渲染一个任务行（仅在任务状态有变化时调用）"""
+        # 创建进度条文本
+        progress_bar = self.create_progress_bar(task.progress)
+        
+        # 格式化大小
+        size_str = ""
+        if task.total_bytes > 0:
+            size_str = f"{self.format_size(task.downloaded_bytes)} / {self.format_size(task.total_bytes)}"
+        elif task.downloaded_bytes > 0:
+            size_str = f"{self.format_size(task.downloaded_bytes)}"
+        
+        # 状态图标和行标签（颜色已在创建列表时按状态配置好）
+        status_text = self._STATUS_STYLES[task.status][0]
+        status_tag = self._STATUS_TAGS[task.status]
+        
+        # 格式化时间
+        time_str = ""
+        if task.start_time > 0:
+            if task.end_time > 0:
+                # 已完成
+                duration = task.end_time - task.start_time
+                time_str = f"耗时: {self.format_duration(duration)}"
             else:
-                # 删除不再需要的线程节点
-                for child in self.task_tree.get_children(task.task_id):
-                    if child.startswith(f"{task.task_id}_thread_"):
-                        self.task_tree.delete(child)
-        
-        # 恢复选中项
-        if selected:
+                # 进行中
+                duration = now - task.start_time
+                time_str = f"已运行: {self.format_duration(duration)}"
+        
+        # 插入新任务作为父节点，或更新有变化的任务
+        self._render_row("", task.task_id, "📁", (
+            task.name,
+            status_text,
+            progress_bar,
+            task.speed,
+            task.eta,
+            size_str,
+            time_str
+        ))
+        
+        # 设置状态颜色（仅在状态变化时）
+        if self._row_status_tag.get(task.task_id) != status_tag:
             try:
-                self.task_tree.selection_set(selected)
+                self.task_tree.item(task.task_id, tags=(status_tag,))
+                self._row_status_tag[task.task_id] = status_tag
             except Exception:
                 pass
+        
+        # 不再下载时删除线程节点
+        if task.status != TaskStatus.DOWNLOADING:
+            for child in self._thread_node_ids.pop(task.task_id, ()):
+                self._delete_row(child)
     
-    def _update_thread_nodes(self, task_id: str):
-        """更新任务下的线程节点"""
+    def _update_thread_nodes(self, task_id: str, force: bool = False):
+        """
+        更新任务下的线程节点
+        
+        任务行折叠时子节点不可见，只要已有线程节点（保证显示展开箭头）就跳过刷新，
+        展开时由 <<TreeviewOpen>> 事件以 force=True 立即刷新
+        """
         try:
+            if (not force and self._thread_node_ids.get(task_id)
+                    and not self.task_tree.tk.getboolean(self.task_tree.item(task_id, 'open'))):
+                return
+            
             # 从批量下载器获取调度器
             if task_id in self.batch_downloader.schedulers:
                 scheduler = self.batch_downloader.schedulers[task_id]
                 # 获取活跃下载线程信息
                 active_downloads = scheduler.get_active_downloads_info()
                 
-                # 获取当前所有线程节点
-                existing_thread_nodes = set()
-                for child in self.task_tree.get_children(task_id):
-                    if child.startswith(f"{task_id}_thread_"):
-                        existing_thread_nodes.add(child)
-                
                 # 更新或添加线程节点
+                segment_prefix = f"{task_id}_segment_"
+                node_prefix = f"{task_id}_thread_"
+                shown_thread_nodes = self._thread_node_ids.setdefault(task_id, set())
+                current_thread_nodes = set()
                 for thread_info in active_downloads:
                     thread_task_id = thread_info['task_id']
                     # 只显示属于当前任务的线程
-                    if thread_task_id.startswith(f"{task_id}_segment_"):
-                        thread_node_id = f"{task_id}_thread_{thread_task_id}"
+                    if thread_task_id.startswith(segment_prefix):
+                        thread_node_id = node_prefix + thread_task_id
                         
                         # 提取片段编号
                         segment_num = ""
@@ -1460,43 +1737,31 @@ class ModernM3U8DownloaderApp:
                                 eta_seconds = remaining_bytes / speed_bps
                                 eta_str = self.format_duration(eta_seconds)
                         
-                        if thread_node_id in existing_thread_nodes:
-                            # 更新现有线程节点
-                            self.task_tree.item(thread_node_id, text="  └─", values=(
-                                f"  {segment_num}",
-                                "🔄 下载中",
-                                progress_bar,
-                                speed_str,
-                                eta_str,
-                                size_str,
-                                time_str
-                            ))
-                            existing_thread_nodes.remove(thread_node_id)
-                        else:
-                            # 插入新线程节点
-                            self.task_tree.insert(task_id, tk.END, iid=thread_node_id, text="  └─", values=(
-                                f"  {segment_num}",
-                                "🔄 下载中",
-                                progress_bar,
-                                speed_str,
-                                eta_str,
-                                size_str,
-                                time_str
-                            ))
-                
-                # 删除不再存在的线程节点
-                for thread_node_id in existing_thread_nodes:
-                    self.task_tree.delete(thread_node_id)
+                        # 插入新线程节点，或更新有变化的线程节点
+                        self._render_row(task_id, thread_node_id, "  └─", (
+                            f"  {segment_num}",
+                            "🔄 下载中",
+                            progress_bar,
+                            speed_str,
+                            eta_str,
+                            size_str,
+                            time_str
+                        ))
+                        shown_thread_nodes.add(thread_node_id)
+                        current_thread_nodes.add(thread_node_id)
+                
+                # 删除不再活跃的线程节点（按索引求差集，不扫描树的子节点）
+                for thread_node_id in shown_thread_nodes - current_thread_nodes:
+                    self._delete_row(thread_node_id)
+                    shown_thread_nodes.discard(thread_node_id)
         except Exception as e:
             # 静默处理错误，不影响主流程
             pass
                 
     def create_progress_bar(self, progress):
         """创建进度条文本"""
-        bar_length = 20
-        filled = int(bar_length * progress / 100)
-        bar = "█" * filled + "░" * (bar_length - filled)
-        return f"{bar} {progress:.1f}%"
+        filled = min(max(int(progress) // 5, 0), 20)
+        return f"{_PROGRESS_BARS[filled]} {progress:.1f}%"
         
     def format_duration(self, duration):
         """格式化持续时间"""
@@ -1521,87 +1786,88 @@ class ModernM3U8DownloaderApp:
             except (AttributeError, TypeError):
                 return "-"
         
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
-        
-        if hours > 0:
-            return f"{hours}h {minutes}m {seconds}s"
-        elif minutes > 0:
-            return f"{minutes}m {seconds}s"
-        else:
-            return f"{seconds}s"
+        return _format_seconds(total_seconds)
                 
     def _get_browser_headers(self, url: str) -> dict:
         """获取完整的浏览器请求头，用于避免403错误"""
-        from urllib.parse import urlparse
-        
-        # 解析URL以获取域名和Referer
+        # 解析URL以获取域名和Referer；Referer 只取决于下面几项，按它们缓存
         parsed = urlparse(url)
-        base_url = f"{parsed.scheme}://{parsed.netloc}"
-        referer = base_url
-        
-        # 如果是M3U8或TS文件，尝试从路径推断Referer
-        if '.m3u8' in url or '.ts' in url:
-            # 尝试从路径中提取上级目录作为Referer
-            path_parts = parsed.path.split('/')
-            if len(path_parts) > 1:
-                referer = f"{base_url}/{'/'.join(path_parts[:-1])}/"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Referer': referer,
-            'Accept': '*/*',
-            'Accept-Language': 'zh-CN,zh;q=0.9,en;q=0.8',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'Cache-Control': 'no-cache',
-            'Pragma': 'no-cache'
-        }
-        
+        headers = dict(_BROWSER_HEADERS)
+        headers['Referer'] = _browser_referer(
+            parsed.scheme, parsed.netloc, parsed.path.rpartition('/')[0] if '/' in parsed.path else None,
+            '.m3u8' in url or '.ts' in url
+        )
         return headers
     
+    def _open_with_detected_encoding(self, filepath):
+        """
+        按检测到的编码打开文本文件，供逐行读取
+        
+        每个候选编码都分块严格解码整个文件，第一个能完整解码的编码胜出；不把文件读成一个字符串。
+        只检测文件开头会把后面才出现的 GBK 等字节误判为 UTF-8
+        """
+        encoding = None
+        for candidate in self._FILE_ENCODINGS:
+            if _file_decodes_as(filepath, candidate):
+                encoding = candidate
+                break
+        
+        if encoding is None:
+            # 尝试使用chardet检测编码(如果可用)
+            try:
+                import chardet
+                with open(filepath, 'rb') as f:
+                    encoding = chardet.detect(f.read(65536))['encoding']
+            except ImportError:
+                pass
+        
+        if encoding:
+            self.log_message(f"✓ 使用 {encoding} 编码读取文件")
+        else:
+            encoding = 'utf-8'
+            self.log_message("⚠ 使用 UTF-8 编码(忽略错误)读取文件")
+            # 所有候选编码都无法完整解码时才替换无法解码的字节
+            return open(filepath, 'r', encoding=encoding, errors='replace', newline='')
+        
+        return open(filepath, 'r', encoding=encoding, newline='')
+    
     def _read_file_with_encoding(self, filepath):
-        """读取文件并自动检测编码"""
-        # 常见的编码列表
-        encodings = ['utf-8', 'gbk', 'gb2312', 'gb18030', 'big5', 'shift_jis', 'euc-jp', 'euc-kr', 'iso-8859-1']
+        """读取文件并自动检测编码（文件只读一次，各候选编码在内存中依次尝试解码）"""
+        try:
+            with open(filepath, 'rb') as f:
+                content_bytes = f.read()
+        except Exception as e:
+            raise Exception(f"无法读取文件: {str(e)}")
         
-        for encoding in encodings:
+        content = None
+        for encoding in self._FILE_ENCODINGS:
             try:
-                with open(filepath, 'r', encoding=encoding) as f:
-                    content = f.read()
+                content = content_bytes.decode(encoding)
                 self.log_message(f"✓ 使用 {encoding} 编码成功读取文件")
-                return content
+                break
             except UnicodeDecodeError:
                 continue
-            except Exception as e:
-                self.log_message(f"✗ 使用 {encoding} 编码读取文件时出错: {str(e)}")
-                continue
         
-        # 如果所有编码都失败,使用二进制模式读取并尝试解码
-        try:
-            with open(filepath, 'rb') as f:
-                content_bytes = f.read()
+        if content is None:
             # 尝试使用chardet检测编码(如果可用)
             try:
                 import chardet
-                detected = chardet.detect(content_bytes)
-                encoding = detected['encoding']
+                encoding = chardet.detect(content_bytes)['encoding']
                 if encoding:
                     content = content_bytes.decode(encoding, errors='ignore')
                     self.log_message(f"✓ 使用检测到的 {encoding} 编码成功读取文件")
-                    return content
-            except ImportError:
+            except (ImportError, LookupError):
                 pass
+        
+        if content is None:
             # 最后尝试使用utf-8并忽略错误
             content = content_bytes.decode('utf-8', errors='ignore')
             self.log_message("⚠ 使用 UTF-8 编码(忽略错误)读取文件")
-            return content
-        except Exception as e:
-            raise Exception(f"无法读取文件: {str(e)}")
+        
+        # 与文本模式读取一致，统一换行符
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        return content
 
     def download_m3u8_task(self, task_id, url, folder, thread_count, retry_count, auto_merge):
         """下载 M3U8 文件并解析（任务版本）- 使用高级多线程下载优化"""
@@ -1633,7 +1899,7 @@ class ModernM3U8DownloaderApp:
             else:
                 # 网络 M3U8 链接 - 添加浏览器请求头以避免403错误
                 headers = self._get_browser_headers(m3u8_url)
-                response = requests.get(m3u8_url, headers=headers, timeout=15)
+                response = self.http_session.get(m3u8_url, headers=headers, timeout=15)
                 response.raise_for_status()
                 m3u8_content = response.text
                 # 修复base_url生成逻辑，正确处理URL路径
@@ -1643,31 +1909,22 @@ class ModernM3U8DownloaderApp:
                 else:
                     base_url = f'{parsed_url.scheme}://{parsed_url.netloc}/'
             
-            # 解析 M3U8 内容，提取 TS 片段链接
+            # 解析 M3U8 内容，一次遍历同时提取子M3U8链接和 TS 片段行
             ts_segments = []
-            lines = m3u8_content.split('\n')
+            sub_lines, ts_lines = _scan_m3u8(m3u8_content)
             
             # 首先检查是否是主M3U8文件（包含子M3U8链接）
-            sub_m3u8_urls = []
-            for line in lines:
-                line = line.strip()
-                if line and not line.startswith('#') and '.m3u8' in line:
-                    # 这是一个子M3U8文件链接
-                    if line.startswith('http'):
-                        sub_m3u8_url = line
-                    else:
-                        sub_m3u8_url = urljoin(base_url, line)
-                    sub_m3u8_urls.append(sub_m3u8_url)
+            sub_m3u8_urls = [_resolve_segment_url(base_url, line) for line in sub_lines]
             
             # 如果有子M3U8文件，获取第一个子M3U8文件的内容
             if sub_m3u8_urls:
                 self.log_message(f"发现 {len(sub_m3u8_urls)} 个子M3U8文件，获取第一个...")
                 try:
                     sub_headers = self._get_browser_headers(sub_m3u8_urls[0])
-                    sub_response = requests.get(sub_m3u8_urls[0], headers=sub_headers, timeout=15)
+                    sub_response = self.http_session.get(sub_m3u8_urls[0], headers=sub_headers, timeout=15)
                     sub_response.raise_for_status()
-                    m3u8_content = sub_response.text
                     # 重新解析子M3U8文件，更新base_url为子M3U8文件的路径
+                    _, ts_lines = _scan_m3u8(sub_response.text)
                     parsed_sub_url = urlparse(sub_m3u8_urls[0])
                     if parsed_sub_url.path and '/' in parsed_sub_url.path:
                         base_url = f'{parsed_sub_url.scheme}://{parsed_sub_url.netloc}{os.path.dirname(parsed_sub_url.path)}/'
@@ -1677,22 +1934,12 @@ class ModernM3U8DownloaderApp:
                 except Exception as sub_e:
                     self.log_message(f"获取子M3U8文件失败: {sub_e}，继续使用原始内容")
             
-            # 重新解析TS片段
-            lines = m3u8_content.split('\n')
-            for i, line in enumerate(lines):
-                line = line.strip()
-                if line and not line.startswith('#') and line.endswith('.ts'):
-                    # 这是一个 TS 片段链接
-                    if line.startswith('http'):
-                        ts_url = line
-                    else:
-                        ts_url = urljoin(base_url, line)
-                    
-                    # 使用任务ID前8位作为文件名前缀，避免多任务时文件名冲突
-                    task_prefix = task_id[:8] if task_id else "unknown"
-                    filename = f"{task_prefix}_segment_{i+1:05d}.ts"
-                    filepath = os.path.join(folder, filename)
-                    ts_segments.append((ts_url, filepath))
+            # 生成 TS 片段链接和保存路径
+            # 使用任务ID前8位作为文件名前缀，避免多任务时文件名冲突
+            task_prefix = task_id[:8] if task_id else "unknown"
+            path_prefix = os.path.join(folder, f"{task_prefix}_segment_")
+            for i, line in ts_lines:
+                ts_segments.append((_resolve_segment_url(base_url, line), f"{path_prefix}{i+1:05d}.ts"))
             
             if not ts_segments:
                 raise Exception("未找到 TS 片段")
@@ -1811,9 +2058,7 @@ class ModernM3U8DownloaderApp:
 
                             # 验证目录存在并包含TS文件
                             if os.path.exists(download_folder):
-                                import re
-                                ts_pattern = re.compile(r'^[a-f0-9]{8}_segment_\d{5}\.ts$')
-                                ts_files = [f for f in os.listdir(download_folder) if f.endswith('.ts') and ts_pattern.match(f)]
+                                ts_files = [f for f in os.listdir(download_folder) if _TS_SEGMENT_RE.match(f)]
                                 if ts_files:
                                     self.log_message(f"🎬 找到 {len(ts_files)} 个TS文件，准备合并")
                                     self.root.after(0, lambda: self.merge_segments_auto_task(task_id, download_folder))
@@ -1866,7 +2111,7 @@ class ModernM3U8DownloaderApp:
             else:
                 # 网络 M3U8 链接 - 添加浏览器请求头以避免403错误
                 headers = self._get_browser_headers(url)
-                response = requests.get(url, headers=headers, timeout=15)
+                response = self.http_session.get(url, headers=headers, timeout=15)
                 response.raise_for_status()
                 m3u8_content = response.text
                 # 修复base_url生成逻辑，正确处理URL路径
@@ -1876,31 +2121,22 @@ class ModernM3U8DownloaderApp:
                 else:
                     base_url = f'{parsed_url.scheme}://{parsed_url.netloc}/'
             
-            # 解析 M3U8 内容，提取 TS 片段链接
+            # 解析 M3U8 内容，一次遍历同时提取子M3U8链接和 TS 片段行
             ts_segments = []
-            lines = m3u8_content.split('\n')
+            sub_lines, ts_lines = _scan_m3u8(m3u8_content)
             
             # 首先检查是否是主M3U8文件（包含子M3U8链接）
-            sub_m3u8_urls = []
-            for line in lines:
-                line = line.strip()
-                if line and not line.startswith('#') and '.m3u8' in line:
-                    # 这是一个子M3U8文件链接
-                    if line.startswith('http'):
-                        sub_m3u8_url = line
-                    else:
-                        sub_m3u8_url = urljoin(base_url, line)
-                    sub_m3u8_urls.append(sub_m3u8_url)
+            sub_m3u8_urls = [_resolve_segment_url(base_url, line) for line in sub_lines]
             
             # 如果有子M3U8文件，获取第一个子M3U8文件的内容
             if sub_m3u8_urls:
                 self.log_message(f"发现 {len(sub_m3u8_urls)} 个子M3U8文件，获取第一个...")
                 try:
                     sub_headers = self._get_browser_headers(sub_m3u8_urls[0])
-                    sub_response = requests.get(sub_m3u8_urls[0], headers=sub_headers, timeout=15)
+                    sub_response = self.http_session.get(sub_m3u8_urls[0], headers=sub_headers, timeout=15)
                     sub_response.raise_for_status()
-                    m3u8_content = sub_response.text
                     # 重新解析子M3U8文件，更新base_url为子M3U8文件的路径
+                    _, ts_lines = _scan_m3u8(sub_response.text)
                     parsed_sub_url = urlparse(sub_m3u8_urls[0])
                     if parsed_sub_url.path and '/' in parsed_sub_url.path:
                         base_url = f'{parsed_sub_url.scheme}://{parsed_sub_url.netloc}{os.path.dirname(parsed_sub_url.path)}/'
@@ -1910,17 +2146,9 @@ class ModernM3U8DownloaderApp:
                 except Exception as sub_e:
                     self.log_message(f"获取子M3U8文件失败: {sub_e}，继续使用原始内容")
             
-            # 重新解析TS片段
-            lines = m3u8_content.split('\n')
-            for line in lines:
-                line = line.strip()
-                if line and not line.startswith('#') and line.endswith('.ts'):
-                    # 这是一个 TS 片段链接
-                    if line.startswith('http'):
-                        ts_url = line
-                    else:
-                        ts_url = urljoin(base_url, line)
-                    ts_segments.append(ts_url)
+            # 生成 TS 片段链接
+            for _, line in ts_lines:
+                ts_segments.append(_resolve_segment_url(base_url, line))
                     
             if not ts_segments:
                 task_manager.set_task_error(task_id, "未找到 TS 片段")
@@ -1955,42 +2183,36 @@ class ModernM3U8DownloaderApp:
             task_manager.update_task_progress(task_id, 0.0, 0, total_bytes)
             
             # 下载所有 TS 片段 - 使用优化下载器
-            download_threads = []
-            for i, ts_url in enumerate(ts_segments):
-                # 检查任务是否被停止
-                task = task_manager.get_task(task_id)
-                if not task or task.status == TaskStatus.STOPPED:
-                    break
+            # 固定大小的线程池执行所有片段，不再为每个片段单独创建线程；
+            # 退出 with 块时等待所有已提交的片段完成
+            with ThreadPoolExecutor(max_workers=thread_count, thread_name_prefix="m3u8-seg") as executor:
+                for i, ts_url in enumerate(ts_segments):
+                    # 检查任务是否被停止
+                    task = task_manager.get_task(task_id)
+                    if not task or task.status == TaskStatus.STOPPED:
+                        break
+                        
+                    # 生成文件名 - 添加任务ID前缀避免冲突
+                    task_prefix = task_id[:8] if task_id else "unknown"
+                    filename = f"{task_prefix}_segment_{i+1:05d}.ts"
+                    filepath = os.path.join(folder, filename)
                     
-                # 生成文件名 - 添加任务ID前缀避免冲突
-                task_prefix = task_id[:8] if task_id else "unknown"
-                filename = f"{task_prefix}_segment_{i+1:05d}.ts"
-                filepath = os.path.join(folder, filename)
-                
-                # 获取下载器实例
-                downloader = self.download_pool.get_downloader()
-                
-                # 创建停止检查函数
-                def make_stop_check(task_id):
-                    return lambda: not task_manager.get_task(task_id) or task_manager.get_task(task_id).status == TaskStatus.STOPPED
-                
-                # 创建带绑定参数的进度回调函数
-                def make_progress_callback(task_id, estimated_total):
-                    return lambda d, t: self.update_task_progress_callback(task_id, d, t, estimated_total)
-                
-                # 创建下载线程（信号量在下载器内部管理）
-                thread = threading.Thread(
-                    target=self._download_segment_with_optimizer,
-                    args=(downloader, task_id, ts_url, filepath, semaphore, retry_count, 
-                          make_progress_callback(task_id, total_bytes), make_stop_check(task_id))
-                )
-                thread.daemon = True
-                thread.start()
-                download_threads.append(thread)
-                
-            # 等待所有下载线程完成
-            for thread in download_threads:
-                thread.join()
+                    # 获取下载器实例
+                    downloader = self.download_pool.get_downloader()
+                    
+                    # 创建停止检查函数
+                    def make_stop_check(task_id):
+                        return lambda: not task_manager.get_task(task_id) or task_manager.get_task(task_id).status == TaskStatus.STOPPED
+                    
+                    # 创建带绑定参数的进度回调函数
+                    def make_progress_callback(task_id, estimated_total):
+                        return lambda d, t: self.update_task_progress_callback(task_id, d, t, estimated_total)
+                    
+                    executor.submit(
+                        self._download_segment_with_optimizer,
+                        downloader, task_id, ts_url, filepath, semaphore, retry_count,
+                        make_progress_callback(task_id, total_bytes), make_stop_check(task_id)
+                    )
                 
             # 检查任务状态
             task = task_manager.get_task(task_id)
@@ -2015,6 +2237,10 @@ class ModernM3U8DownloaderApp:
         # 在下载前获取信号量，并确保在结束时释放以防止槽位泄漏
         semaphore.acquire()
         try:
+            # 排队期间任务可能已被停止，此时不再发起请求
+            if stop_check():
+                return
+            
             self.log_message(f"🔄 开始下载片段: {os.path.basename(filepath)} (URL: {url})")
 
             success = downloader.download_segment(
@@ -2126,7 +2352,7 @@ class ModernM3U8DownloaderApp:
                         headers['Range'] = f'bytes={downloaded_bytes}-'
                         self.log_message(f"  - 使用断点续传，从第 {downloaded_bytes} 字节开始")
                     
-                    response = requests.get(url, timeout=15, stream=True, headers=headers)
+                    response = self.http_session.get(url, timeout=15, stream=True, headers=headers)
                     self.log_message(f"  - HTTP响应状态码: {response.status_code}")
                     
                     # 处理 Range 请求的响应
@@ -2139,7 +2365,8 @@ class ModernM3U8DownloaderApp:
                     else:
                         self.log_message(f"  - 意外状态码 {response.status_code}，重新开始下载")
                         downloaded_bytes = 0
-                        response = requests.get(url, timeout=15, stream=True)
+                        response.close()  # 未读取的流式响应要先关闭，否则连接无法归还连接池
+                        response = self.http_session.get(url, timeout=15, stream=True)
                         response.raise_for_status()
                     
                     # 获取文件大小
@@ -2159,6 +2386,7 @@ class ModernM3U8DownloaderApp:
                             task = task_manager.get_task(task_id)
                             if not task or task.status == TaskStatus.STOPPED:
                                 self.log_message(f"  - 任务被停止，中断下载")
+                                response.close()
                                 semaphore.release()
                                 return
                                 
@@ -2220,9 +2448,7 @@ class ModernM3U8DownloaderApp:
             self.log_message(f"🔍 扫描目录: {folder}")
             all_files = os.listdir(folder)
             # 匹配格式: {task_prefix}_segment_xxxxx.ts
-            import re
-            ts_pattern = re.compile(r'^[a-f0-9]{8}_segment_\d{5}\.ts$')
-            ts_files = [os.path.join(folder, f) for f in all_files if f.endswith('.ts') and ts_pattern.match(f)]
+            ts_files = [os.path.join(folder, f) for f in all_files if _TS_SEGMENT_RE.match(f)]
 
             self.log_message(f"📊 目录总文件数: {len(all_files)}")
             self.log_message(f"🎬 找到 TS 文件数: {len(ts_files)}")
@@ -2682,7 +2908,7 @@ class ModernM3U8DownloaderApp:
             return
             
         # 执行合并操作
-        self.status_var.set("正在合并 TS 片段...")
+        self._set_var(self.status_var, "正在合并 TS 片段...")
         self.log_message(f"🔄 开始合并 {len(ts_files)} 个 TS 片段...")
         
         # 在新线程中执行合并操作
@@ -2727,18 +2953,18 @@ class ModernM3U8DownloaderApp:
             
             if process.returncode == 0:
                 self.log_message("✓ TS 片段合并完成!")
-                self.status_var.set("合并完成")
+                self._set_var(self.status_var, "合并完成")
                 messagebox.showinfo("成功", f"视频已成功合并到:\n{output_file}")
             else:
                 error_msg = stderr.strip() if stderr else "合并失败"
                 self.log_message(f"✗ 合并失败: {error_msg}")
-                self.status_var.set("合并失败")
+                self._set_var(self.status_var, "合并失败")
                 messagebox.showerror("错误", f"合并过程中出现错误:\n{error_msg}")
                 
         except Exception as e:
             error_msg = str(e)
             self.log_message(f"✗ 合并过程中出现异常: {error_msg}")
-            self.status_var.set("合并异常")
+            self._set_var(self.status_var, "合并异常")
             messagebox.showerror("错误", f"合并过程中出现异常:\n{error_msg}")
             
     def format_time(self, seconds):
@@ -2941,10 +3167,8 @@ class ModernM3U8DownloaderApp:
 
     def _parse_download_error(self, error_msg):
         """解析下载错误信息，提供更详细的HTTP状态码和错误原因"""
-        import re
-        
         # 提取HTTP状态码
-        status_code_match = re.search(r'HTTP.*?(\d{3})', error_msg, re.IGNORECASE)
+        status_code_match = _HTTP_STATUS_RE.search(error_msg)
         if status_code_match:
             status_code = status_code_match.group(1)
             status_messages = {
@@ -13,7 +13,8 @@ from typing import Callable, Optional
 class DownloadSession:
     """优化的HTTP会话管理，支持连接池和重试机制"""
     
-    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=3):
+    def __init__(self, pool_connections=10, pool_maxsize=10, max_retries=3,
+                 session: Optional[requests.Session] = None):
         """
         初始化下载会话
         
@@ -21,7 +22,16 @@ class DownloadSession:
             pool_connections: 连接池大小
             pool_maxsize: 最大连接数
             max_retries: 最大重试次数
+            session: 外部共享的会话；指定时直接复用其连接池，且关闭时不关闭该会话
         """
+        # 设置默认超时
+        self.timeout = 30
+        
+        self._owns_session = session is None
+        if session is not None:
+            self.session = session
+            return
+        
         self.session = requests.Session()
         
         # 配置重试策略
@@ -42,9 +52,6 @@ class DownloadSession:
         self.session.mount("http://", adapter)
         self.session.mount("https://", adapter)
         
-        # 设置默认超时
-        self.timeout = 30
-        
     def get(self, url, **kwargs):
         """发送GET请求"""
         kwargs.setdefault('timeout', self.timeout)
@@ -56,24 +63,27 @@ class DownloadSession:
         return self.session.head(url, **kwargs)
     
     def close(self):
-        """关闭会话"""
-        self.session.close()
+        """关闭会话（共享的外部会话由其创建者负责关闭）"""
+        if self._owns_session:
+            self.session.close()
 
 
 class OptimizedDownloader:
     """优化的下载器，支持速度限制和智能并发控制"""
     
-    def __init__(self, max_speed: Optional[int] = None, chunk_size: int = 65536):
+    def __init__(self, max_speed: Optional[int] = None, chunk_size: int = 65536,
+                 session: Optional[requests.Session] = None):
         """
         初始化下载器
         
         Args:
             max_speed: 最大下载速度（字节/秒），None表示无限制
             chunk_size: 下载块大小（字节）
+            session: 外部共享的HTTP会话，None表示创建独立会话
         """
         self.max_speed = max_speed
         self.chunk_size = chunk_size
-        self.session = DownloadSession()
+        self.session = DownloadSession(session=session)
         self._lock = threading.Lock()
         self._last_download_time = time.time()
         self._downloaded_bytes = 0
@@ -236,13 +246,15 @@ class OptimizedDownloader:
 class DownloadPool:
     """下载池，管理多个下载器实例"""
     
-    def __init__(self, pool_size: int = 5, max_speed: Optional[int] = None):
+    def __init__(self, pool_size: int = 5, max_speed: Optional[int] = None,
+                 session: Optional[requests.Session] = None):
         """
         初始化下载池
         
         Args:
             pool_size: 池大小
             max_speed: 最大下载速度（字节/秒）
+            session: 所有下载器共用的HTTP会话，None表示每个下载器各自创建会话
         """
         self.pool_size = pool_size
         self.max_speed = max_speed
@@ -252,7 +264,7 @@ class DownloadPool:
         
         # 创建下载器实例
         for _ in range(pool_size):
-            downloader = OptimizedDownloader(max_speed=max_speed)
+            downloader = OptimizedDownloader(max_speed=max_speed, session=session)
             self.downloaders.append(downloader)
     
     def get_downloader(self) -> OptimizedDownloader:
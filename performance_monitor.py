@@ -6,7 +6,9 @@
 import time
 import threading
 import json
-from typing import Dict, List, Optional
+import queue
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
 from datetime import datetime
 from advanced_downloader import get_batch_downloader
 
@@ -27,25 +29,156 @@ class PerformanceMonitor:
         self._performance_history: List[Dict] = []
         self._max_history_size = 1000
         
-    def start_monitoring(self):
-        """开始性能监控"""
-        if not self._monitoring:
+        # 下载事件写入 SimpleQueue（C实现，put不需要额外加锁），由监控线程批量取出，
+        # 在消费端维护累计值；查询接口直接返回预先算好的只读快照
+        self._events: queue.SimpleQueue = queue.SimpleQueue()
+        self._drain_lock = threading.Lock()  # 保证同一时间只有一个消费者在累加
+        self._total_tasks = 0
+        self._successful_tasks = 0
+        self._total_downloaded = 0
+        self._total_download_ns = 0  # 累计下载耗时（整数纳秒，累加无精度损失）
+        self._speed_ewma = 0.0  # 每批事件整体下载速度的指数加权平均（字节/秒）
+        self._ewma_alpha = 0.2
+        self._snapshot: Mapping = MappingProxyType(self._build_snapshot())
+        
+        # 监控线程等待在条件变量上：事件积累到阈值时由生产者唤醒批量汇总，
+        # 否则到报告时间才醒来；停止监控时也会立即被唤醒。
+        # 监控线程首次启动后常驻，停止只是让它暂停等待，再次启动不需要重新创建线程
+        self._cv = threading.Condition()
+        self._pending = 0  # 上次汇总后新记录的事件数（无锁计数，仅作唤醒提示）
+        self._flush_threshold = 64
+        
+    def start_monitoring(self, interval: Optional[float] = None):
+        """
+        开始性能监控
+        
+        Args:
+            interval: 报告间隔时间（秒），不指定时使用初始化时的 report_interval
+        """
+        with self._cv:
+            if interval is not None:
+                self.report_interval = interval
+            if self._monitoring:
+                return
             self._monitoring = True
-            self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
-            self._monitor_thread.start()
-            print("📊 性能监控已启动")
+            if self._monitor_thread is None:
+                self._monitor_thread = threading.Thread(target=self._monitor_loop, daemon=True)
+                self._monitor_thread.start()
+            else:
+                self._cv.notify()
+        print("📊 性能监控已启动")
     
     def stop_monitoring(self):
-        """停止性能监控"""
-        self._monitoring = False
-        if self._monitor_thread:
-            self._monitor_thread.join(timeout=5.0)
-            print("📊 性能监控已停止")
+        """停止性能监控（监控线程转入暂停状态）"""
+        with self._cv:
+            if not self._monitoring:
+                return
+            self._monitoring = False
+            self._cv.notify()
+        print("📊 性能监控已停止")
+    
+    def record_download_event(self, task_id: str, url: str, file_size: int,
+                              download_time: float, success: bool):
+        """记录一次下载事件（只入队，统计由监控线程汇总）"""
+        self._events.put_nowait((task_id, url, file_size, download_time, success))
+        
+        self._pending += 1
+        if self._pending >= self._flush_threshold:
+            with self._cv:
+                self._cv.notify()
+    
+    def _drain_events(self):
+        """批量取出队列中的事件，更新累计值后整体替换统计快照"""
+        with self._drain_lock:
+            # 逐个事件只做整数累加，速度等浮点运算每批只算一次
+            drained = successful = 0
+            total_ns = success_ns = success_bytes = 0
+            try:
+                while True:
+                    _task_id, _url, file_size, download_time, success = self._events.get_nowait()
+                    elapsed_ns = int(download_time * 1_000_000_000)
+                    drained += 1
+                    total_ns += elapsed_ns
+                    if success:
+                        successful += 1
+                        success_ns += elapsed_ns
+                        success_bytes += file_size
+            except queue.Empty:
+                pass
+            
+            if drained:
+                self._total_tasks += drained
+                self._successful_tasks += successful
+                self._total_downloaded += success_bytes
+                self._total_download_ns += total_ns
+                if success_ns > 0:
+                    speed = success_bytes * 1_000_000_000 / success_ns
+                    alpha = self._ewma_alpha
+                    self._speed_ewma = speed if self._speed_ewma == 0 else \
+                        alpha * speed + (1 - alpha) * self._speed_ewma
+                self._snapshot = MappingProxyType(self._build_snapshot())
+    
+    def _build_snapshot(self) -> Dict:
+        """根据累计值生成统计快照（速度单位MB/s，成功率为0-1的比例）"""
+        total = self._total_tasks
+        total_seconds = self._total_download_ns / 1_000_000_000
+        return {
+            'total_tasks': total,
+            'successful_tasks': self._successful_tasks,
+            'failed_tasks': total - self._successful_tasks,
+            'total_downloaded': self._total_downloaded,
+            'total_download_time': total_seconds,
+            'success_rate': self._successful_tasks / total if total else 0.0,
+            'current_download_speed': self._speed_ewma / (1024 * 1024),
+            'average_download_speed': (self._total_downloaded / total_seconds / (1024 * 1024)
+                                       if total_seconds > 0 else 0.0)
+        }
+    
+    def get_current_stats(self) -> Mapping:
+        """
+        获取下载事件统计快照（只读）
+        
+        快照由监控线程维护；仅当队列里还有未汇总的事件时才在调用线程中补做一次汇总
+        """
+        if not self._events.empty():
+            self._drain_events()
+        return self._snapshot
+    
+    def get_historical_stats(self) -> Mapping:
+        """获取自创建以来的累计下载事件统计（与 get_current_stats 共用同一快照）"""
+        return self.get_current_stats()
+    
+    def _should_wake(self) -> bool:
+        return not self._monitoring or self._pending >= self._flush_threshold
+    
+    def _is_monitoring(self) -> bool:
+        return self._monitoring
     
     def _monitor_loop(self):
-        """监控循环"""
-        while self._monitoring:
+        """监控循环（常驻线程，停止监控期间阻塞等待）"""
+        last_report = None
+        while True:
             try:
+                with self._cv:
+                    if not self._monitoring:
+                        self._cv.wait_for(self._is_monitoring)
+                        last_report = None
+                    if last_report is None:
+                        last_report = time.monotonic() - self.report_interval  # 启动后立即输出一次报告
+                    timeout = max(0.0, last_report + self.report_interval - time.monotonic())
+                    self._cv.wait_for(self._should_wake, timeout=timeout)
+                if not self._monitoring:
+                    continue
+                
+                self._pending = 0
+                self._drain_events()
+                
+                # 事件积累触发的唤醒只做汇总，到报告时间才采集并输出报告
+                now = time.monotonic()
+                if now - last_report < self.report_interval:
+                    continue
+                last_report = now
+                
                 # 获取当前性能统计
                 stats = self._collect_current_stats()
                 
@@ -63,8 +196,6 @@ class PerformanceMonitor:
                     # 打印实时报告
                     self._print_realtime_report(stats)
                 
-                time.sleep(self.report_interval)
-                
             except Exception as e:
                 print(f"性能监控循环出错: {e}")
                 time.sleep(5.0)
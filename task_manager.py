@@ -23,6 +23,9 @@ class TaskStatus(Enum):
     FAILED = "已失败"
     STOPPED = "已停止"
 
+# 已结束的任务状态：不再持久化到任务文件，可从任务列表中清除
+FINISHED_STATUSES = frozenset({TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.STOPPED})
+
 @dataclass
 class DownloadTask:
     """下载任务数据类"""
@@ -84,7 +87,7 @@ class TaskManager:
             with self.lock:
                 for task_id, task in self.tasks.items():
                     # 不保存已完成、已失败或已停止的任务
-                    if task.status not in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.STOPPED]:
+                    if task.status not in FINISHED_STATUSES:
                         tasks_to_save[task_id] = task.to_dict()
             
             # 写入文件
@@ -107,7 +110,7 @@ class TaskManager:
                     try:
                         task = DownloadTask.from_dict(task_data)
                         # 只加载未完成的任务，并将其状态设置为等待中
-                        if task.status not in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.STOPPED]:
+                        if task.status not in FINISHED_STATUSES:
                             task.status = TaskStatus.PENDING
                             self.tasks[task_id] = task
                     except Exception:
@@ -151,16 +154,24 @@ class TaskManager:
     
     def update_task_status(self, task_id: str, status: TaskStatus):
         """更新任务状态"""
+        self.update_tasks_status((task_id,), status)
+    
+    def update_tasks_status(self, task_ids, status: TaskStatus):
+        """批量更新任务状态，所有任务更新完后只通知监听器和保存文件一次"""
+        now = time.time()
         with self.lock:
-            if task_id in self.tasks:
-                self.tasks[task_id].status = status
+            for task_id in task_ids:
+                task = self.tasks.get(task_id)
+                if task is None:
+                    continue
+                task.status = status
                 if status == TaskStatus.DOWNLOADING:
-                    self.tasks[task_id].start_time = time.time()
-                elif status in [TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.STOPPED]:
-                    self.tasks[task_id].end_time = time.time()
+                    task.start_time = now
+                elif status in FINISHED_STATUSES:
+                    task.end_time = now
                     # 如果任务完成，添加到历史记录
                     if status == TaskStatus.COMPLETED:
-                        self._add_to_history(self.tasks[task_id])
+                        self._add_to_history(task)
                     
         self._notify_listeners()
         self.save_tasks()
@@ -270,9 +281,13 @@ class TaskManager:
     
     def remove_task(self, task_id: str):
         """移除任务"""
+        self.remove_tasks((task_id,))
+    
+    def remove_tasks(self, task_ids):
+        """批量移除任务，所有任务移除后只通知监听器和保存文件一次"""
         with self.lock:
-            if task_id in self.tasks:
-                del self.tasks[task_id]
+            for task_id in task_ids:
+                self.tasks.pop(task_id, None)
                 
         self._notify_listeners()
         self.save_tasks()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高级下载器测试 - 验证等待任务结束的接口不会丢失唤醒
+"""
+import os
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import advanced_downloader
+except ImportError as e:  # requests 未安装时跳过
+    raise unittest.SkipTest(f"无法导入 advanced_downloader: {e}")
+
+from advanced_downloader import BatchDownloader, SmartDownloadScheduler
+
+
+def _fake_download(self, task, slot):
+    """模拟一次很快完成的片段下载，不发起网络请求"""
+    time.sleep(0.005)
+    return True, 1024, 1024
+
+
+class WaitTaskTest(unittest.TestCase):
+    
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+        patcher = mock.patch.object(SmartDownloadScheduler, '_perform_download', _fake_download)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_wait_task_returns_once_all_segments_finish(self):
+        downloader = BatchDownloader(max_concurrent_tasks=1, max_concurrent_downloads_per_task=2)
+        segments = [(f"http://example.com/seg{i}.ts", os.path.join(self._tmpdir.name, f"seg{i}.ts"))
+                    for i in range(8)]
+        
+        for _ in range(20):
+            task_id = f"task_{_}"
+            downloader.add_m3u8_task(task_id, segments)
+            
+            start = time.monotonic()
+            self.assertTrue(downloader.wait_task(task_id, timeout=None))
+            self.assertLess(time.monotonic() - start, 2.0)
+            
+            scheduler = downloader.schedulers[task_id]
+            self.assertEqual(len(scheduler.completed_downloads), len(segments))
+            self.assertTrue(all(result.success for result in scheduler.completed_downloads.values()))
+            scheduler.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()